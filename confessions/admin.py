@@ -1,15 +1,141 @@
-from django.contrib import admin
-from .models import Confession
+from django.contrib import admin, messages
+from django.utils.text import slugify
+from . import exports, moderation
+from .models import Comment, Community, Confession
+from .pagination import EstimatedCountPaginator
+from .search import get_search_backend
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist defaults for tables too big to count: an estimated count
+    instead of ``COUNT(*)``, and no second count of the unfiltered table.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_actions(self, request):
+        # The stock action loads and lists every selected row and its
+        # dependents before deleting them one by one.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
 
 @admin.register(Confession)
-class ConfessionAdmin(admin.ModelAdmin):
+class ConfessionAdmin(LargeTableAdmin):
     """Admin view for the Confession model."""
-    list_display = ('id', 'content_snippet', 'created_at', 'upvotes')
-    list_filter = ('created_at',)
+    list_display = (
+        'id', 'content_snippet', 'status', 'created_at', 'upvotes', 'comment_count', 'author', 'community',
+    )
+    list_filter = ('status', 'reviewed_at', 'created_at')
+    list_select_related = ('author', 'community')
     search_fields = ('content',)
-    ordering = ('-created_at',)
+    # confession_feed_idx leads with the status; ids follow posting order.
+    ordering = ('-id',)
+    raw_id_fields = ('author',)
+    autocomplete_fields = ('community',)
+    actions = (
+        'approve', 'reject', 'delete_confessions', 'remove_from_community', 'export_ndjson', 'export_csv',
+    )
 
     def content_snippet(self, obj):
         """Returns a short snippet of the confession content for the list view."""
         return obj.content[:75] + '...' if len(obj.content) > 75 else obj.content
-    content_snippet.short_description = 'Content Snippet'
\ No newline at end of file
+    content_snippet.short_description = 'Content Snippet'
+
+    def get_search_results(self, request, queryset, search_term):
+        """Searches the full-text index rather than scanning ``content``."""
+        if not search_term.strip():
+            return queryset, False
+        return get_search_backend().filter(queryset, search_term), False
+
+    @admin.action(description='Approve selected confessions', permissions=['change'])
+    def approve(self, request, queryset):
+        changed = moderation.set_confession_status(queryset, Confession.APPROVED)
+        self.message_user(request, f'Approved {changed} confessions.', messages.SUCCESS)
+
+    @admin.action(description='Reject selected confessions', permissions=['change'])
+    def reject(self, request, queryset):
+        changed = moderation.set_confession_status(queryset, Confession.REJECTED)
+        self.message_user(request, f'Rejected {changed} confessions.', messages.SUCCESS)
+
+    @admin.action(description='Delete selected confessions and their comments', permissions=['delete'])
+    def delete_confessions(self, request, queryset):
+        deleted = moderation.delete_confessions(queryset)
+        self.message_user(request, f'Deleted {deleted} confessions.', messages.SUCCESS)
+
+    @admin.action(description='Remove selected confessions from their community', permissions=['change'])
+    def remove_from_community(self, request, queryset):
+        moved = moderation.remove_from_community(queryset)
+        self.message_user(request, f'Removed {moved} confessions from their community.', messages.SUCCESS)
+
+    @admin.action(description='Export selected confessions with comments (NDJSON)')
+    def export_ndjson(self, request, queryset):
+        """Streams the selection as a download rather than building it in memory."""
+        return exports.streaming_response(queryset, 'ndjson')
+
+    @admin.action(description='Export selected confessions with comments (CSV)')
+    def export_csv(self, request, queryset):
+        return exports.streaming_response(queryset, 'csv')
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('id', 'content_snippet', 'status', 'confession', 'author', 'created_at')
+    list_filter = ('status', 'reviewed_at')
+    list_select_related = ('confession', 'author')
+    search_fields = ('content',)
+    # No index leads with created_at; ids follow posting order.
+    ordering = ('-id',)
+    raw_id_fields = ('confession', 'author')
+    actions = ('approve', 'reject', 'delete_comments')
+
+    def content_snippet(self, obj):
+        return obj.content[:75] + '...' if len(obj.content) > 75 else obj.content
+    content_snippet.short_description = 'Content Snippet'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return get_search_backend().filter_comments(queryset, search_term), False
+
+    @admin.action(description='Approve selected comments', permissions=['change'])
+    def approve(self, request, queryset):
+        changed = moderation.set_comment_status(queryset, Comment.APPROVED)
+        self.message_user(request, f'Approved {changed} comments.', messages.SUCCESS)
+
+    @admin.action(description='Reject selected comments', permissions=['change'])
+    def reject(self, request, queryset):
+        changed = moderation.set_comment_status(queryset, Comment.REJECTED)
+        self.message_user(request, f'Rejected {changed} comments.', messages.SUCCESS)
+
+    @admin.action(description='Delete selected comments', permissions=['delete'])
+    def delete_comments(self, request, queryset):
+        deleted = moderation.delete_comments(queryset)
+        self.message_user(request, f'Deleted {deleted} comments.', messages.SUCCESS)
+
+
+@admin.register(Community)
+class CommunityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'confession_count', 'last_activity_at', 'created_by', 'created_at')
+    list_select_related = ('created_by',)
+    # Searches match a prefix of the slug; see get_search_results.
+    search_fields = ('slug',)
+    ordering = ('name',)
+    prepopulated_fields = {'slug': ('name',)}
+    raw_id_fields = ('created_by',)
+    readonly_fields = ('confession_count', 'last_activity_at')
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Communities whose slug starts with the slugified term, so "Night Ow"
+        finds night-owls. That is a range scan of the unique slug index on
+        any backend, where the admin's own ``istartswith``/``iexact`` are
+        case-insensitive LIKEs that no plain index serves.
+        """
+        prefix = slugify(search_term)
+        if not prefix:
+            return queryset, False
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return queryset.filter(slug__gte=prefix, slug__lt=upper), False
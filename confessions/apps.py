@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ConfessionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'confessions'
+
+    def ready(self):
+        from . import leaderboards, moderation, rankings, signals, votes  # noqa: F401
+        from .search import install_sqlite_schema
+        from confizz import passwords
+
+        # Schema migrations that remake a table drop its triggers on SQLite.
+        post_migrate.connect(install_sqlite_schema, sender=self)
+        passwords.warm_up()
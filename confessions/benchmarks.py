@@ -0,0 +1,111 @@
+"""Shared helpers for the ``bench_*`` and ``loadtest`` management commands."""
+import resource
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+from django.db import connection, connections
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """
+    Runs the block against a throwaway test database, leaving real data
+    untouched. Aliases configured as test mirrors of ``default`` (such as
+    the read-only alias) are pointed at it as well.
+    """
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    mirrors = {}
+    for alias in connections:
+        if connections[alias].settings_dict.get('TEST', {}).get('MIRROR') == connection.alias:
+            mirrors[alias] = connections[alias].settings_dict.copy()
+            connections[alias].close()
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        for alias, settings_dict in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict = settings_dict
+        connection.creation.destroy_test_db(old_name, verbosity)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def latency_summary(seconds):
+    """Summarises a list of latencies (in seconds) as milliseconds."""
+    return {
+        'count': len(seconds),
+        'mean_ms': round(statistics.fmean(seconds) * 1000, 3) if seconds else 0.0,
+        'p50_ms': round(percentile(seconds, 50) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 99) * 1000, 3),
+        'max_ms': round(max(seconds) * 1000, 3) if seconds else 0.0,
+    }
+
+
+class Timer:
+    """Context manager recording elapsed wall time in ``elapsed``."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+
+def rss_mb(pid=None):
+    """Current resident set size of ``pid`` (default: this process) in MiB, or None where unknown."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid is None:
+        return peak_rss_mb()
+    return None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def compare_results(baseline, current, threshold=0.2):
+    """
+    Diffs two ``loadtest`` result documents endpoint by endpoint. Returns a
+    list of rows; a row is a regression when a latency percentile grew by
+    more than ``threshold`` (a fraction) or the endpoint ran more queries.
+    """
+    rows = []
+    for name, now in current['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = before['latency'][metric], now['latency'][metric]
+            change = (new - old) / old if old else 0.0
+            rows.append({
+                'endpoint': name, 'metric': metric, 'baseline': old, 'current': new,
+                'change': change, 'regression': change > threshold,
+            })
+        old, new = before.get('queries_per_request'), now.get('queries_per_request')
+        if old is not None and new is not None:
+            rows.append({
+                'endpoint': name, 'metric': 'queries', 'baseline': old, 'current': new,
+                'change': (new - old) / old if old else 0.0, 'regression': new > old,
+            })
+    return rows
@@ -0,0 +1,289 @@
+"""
+Response and fragment caching for the public pages.
+
+Anonymous GET requests to the feed, community and home pages are served
+whole from the cache (``cache_anonymous_page``), unless the visitor has
+voted. Feed cards are cached
+individually for every visitor (``render_cards``), so a page that missed
+still reuses the cards that did not change.
+
+Nothing is deleted on invalidation. Each cache key embeds *version stamps*:
+counters for scopes such as ``feed``, ``communities``, ``community:<id>`` or
+``confession:<id>``, bumped by the model signals in ``signals.py`` (and by
+vote counter updates). Bumping a stamp makes every key that embeds it
+unreachable, and the old entries age out of the cache. Pages and cards
+rendered from a lagging read replica are kept no longer than
+``REPLICA_MAX_LAG``, since they may predate the change that bumped the stamp.
+
+Cached HTML never carries a real CSRF token. Pages and cards are rendered
+with a placeholder which is swapped for the visitor's own token on the way
+out.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+from confizz import instrumentation, routers
+
+CSRF_SENTINEL = 'csrf-token-placeholder-9b1d'
+# Set on the session of an anonymous visitor who has voted: their pages show
+# their own votes, so they are neither cached nor served from the cache.
+VOTED_SESSION_KEY = 'voted'
+_SENTINEL_BYTES = CSRF_SENTINEL.encode()
+
+
+def _cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def _enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', True)
+
+
+def _stamp_key(scope):
+    return f'stamp:{scope}'
+
+
+def get_stamps(*scopes):
+    """Returns the current stamp of each scope, in one cache round trip."""
+    if not scopes:
+        return []
+    cache = _cache()
+    keys = [_stamp_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    stamps = []
+    for key in keys:
+        if key not in found:
+            # Start from the clock rather than 0 so a stamp that was evicted
+            # can never come back with a value it already had.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        stamps.append(found[key])
+    return stamps
+
+
+def _bump_now(scopes):
+    cache = _cache()
+    for scope in scopes:
+        try:
+            cache.incr(_stamp_key(scope))
+        except ValueError:
+            cache.set(_stamp_key(scope), time.time_ns(), None)
+
+
+def bump(*scopes):
+    """
+    Invalidates everything cached under the given scopes. Inside a
+    transaction the stamps are bumped again on commit, so a page rendered
+    from not-yet-committed data cannot outlive the change.
+    """
+    scopes = [scope for scope in scopes if scope]
+    if not scopes:
+        return
+    _bump_now(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def forget_community_slug(slug):
+    _cache().delete(f'community-id:{slug}')
+
+
+def community_id_for_slug(slug):
+    """Resolves a community slug through the cache; None if there is no such community."""
+    from .models import Community
+
+    key = f'community-id:{slug}'
+    community_id = _cache().get(key)
+    if community_id is None:
+        community_id = Community.objects.filter(slug=slug).values_list('pk', flat=True).first()
+        if community_id is not None:
+            _cache().set(key, community_id, None)
+    return community_id
+
+
+def fill_csrf(content, request):
+    """Swaps the CSRF placeholder in rendered content for the visitor's token."""
+    if isinstance(content, bytes):
+        if _SENTINEL_BYTES in content:
+            content = content.replace(_SENTINEL_BYTES, get_token(request).encode())
+        return content
+    if CSRF_SENTINEL in content:
+        content = content.replace(CSRF_SENTINEL, get_token(request))
+    return content
+
+
+def csrf_placeholder(request):
+    """Context processor rendering ``{% csrf_token %}`` as the placeholder on cached pages."""
+    if getattr(request, '_page_cache_render', False):
+        return {'csrf_token': CSRF_SENTINEL}
+    return {}
+
+
+def render_cards(request, confessions, comment_form):
+    """
+    Renders feed cards, reusing each card cached under its confession's
+    stamp. ``user_voted`` is part of the key, so one entry serves every
+    visitor in the same voted state.
+    """
+    confessions = list(confessions)
+    if not confessions:
+        return ''
+    if not _enabled():
+        return render_to_string('confessions/confession_cards.html', {
+            'confessions': confessions,
+            'comment_form': comment_form,
+        }, request=request)
+
+    cache = _cache()
+    cards_stamp, *stamps = get_stamps('cards', *[f'confession:{confession.pk}' for confession in confessions])
+    keys = [
+        f'card:{confession.pk}:{cards_stamp}:{stamp}:{int(getattr(confession, "user_voted", False))}'
+        for confession, stamp in zip(confessions, stamps)
+    ]
+    found = cache.get_many(keys)
+    missing = {}
+    html = []
+    for confession, key in zip(confessions, keys):
+        if key not in found:
+            found[key] = missing[key] = render_to_string('confessions/confession_card.html', {
+                'confession': confession,
+                'comment_form': comment_form,
+                'csrf_token': CSRF_SENTINEL,
+            }, request=request)
+        html.append(found[key])
+    instrumentation.cache_lookup('cards', hits=len(keys) - len(missing), misses=len(missing))
+    if missing:
+        cache.set_many(missing, routers.replica_cache_timeout(getattr(settings, 'CARD_CACHE_TIMEOUT', 60 * 60)))
+    html = ''.join(html)
+    # Cards going into a cached page keep the placeholder for the page to fill.
+    if getattr(request, '_page_cache_render', False):
+        return html
+    return fill_csrf(html, request)
+
+
+def _cacheable(request):
+    if request.method not in ('GET', 'HEAD') or not _enabled():
+        return False
+    if request.user.is_authenticated or request.session.get(VOTED_SESSION_KEY):
+        return False
+    # A visitor who just posted must see the primary's data, not a page
+    # cached from a replica that had not caught up.
+    if routers.pinned_to_primary(request):
+        return False
+    # Flash messages are rendered once; the page showing them is not shareable.
+    return not len(messages.get_messages(request))
+
+
+def _page_key(request, stamps):
+    query = '&'.join(sorted(f'{key}={value}' for key, values in request.GET.lists() for value in values))
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'page:{digest}:' + ':'.join(str(stamp) for stamp in stamps)
+
+
+def cache_anonymous_page(scopes=None, timeout=None):
+    """
+    Caches a view's full response for anonymous visitors. ``scopes`` is a
+    callable taking the view's arguments and returning the stamp scopes
+    the page depends on; bumping any of them invalidates the page.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+
+            page_scopes = scopes(request, *args, **kwargs) if scopes else []
+            if page_scopes is None:
+                return view(request, *args, **kwargs)
+            cache = _cache()
+            key = _page_key(request, get_stamps(*page_scopes))
+            cached = cache.get(key)
+            instrumentation.cache_lookup('page', hits=cached is not None, misses=cached is None)
+            if cached is not None:
+                response = HttpResponse(fill_csrf(cached['content'], request), content_type=cached['content_type'])
+                for header, value in cached['headers'].items():
+                    response[header] = value
+                response['X-Page-Cache'] = 'hit'
+                return response
+
+            request._page_cache_render = True
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                request._page_cache_render = False
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                headers = {name: response[name] for name in ('X-Next-Cursor',) if response.has_header(name)}
+                page_timeout = timeout if timeout is not None else getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+                cache.set(key, {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'headers': headers,
+                }, routers.replica_cache_timeout(page_timeout))
+                response['X-Page-Cache'] = 'miss'
+            response.content = fill_csrf(response.content, request)
+            return response
+        return wrapper
+    return decorator
+
+
+def _ranked(request):
+    from .rankings import SORTS
+
+    # Ranked orderings change when the rankings refresh, not with each post.
+    return request.GET.get('sort', '') in SORTS
+
+
+def feed_scopes(request, *args, **kwargs):
+    return ['feed', 'rankings'] if _ranked(request) else ['feed']
+
+
+def feed_page_scopes(request, *args, **kwargs):
+    """The feed page also shows the leaderboards."""
+    return feed_scopes(request) + ['leaderboards']
+
+
+def leaderboard_scopes(request, *args, **kwargs):
+    return ['leaderboards']
+
+
+def communities_scopes(request, *args, **kwargs):
+    return ['communities']
+
+
+def comments_scopes(request, pk):
+    return [f'confession:{pk}']
+
+
+def community_scopes(request, slug):
+    community_id = community_id_for_slug(slug)
+    # Unknown slugs are left to the view (and its 404).
+    if community_id is None:
+        return None
+    return [f'community:{community_id}', 'rankings'] if _ranked(request) else [f'community:{community_id}']
+
+
+def confession_scopes(confession_id, community_id):
+    """Stamp scopes showing a confession: its card, the feed and its community."""
+    scopes = ['feed', f'confession:{confession_id}']
+    if community_id:
+        scopes += [f'community:{community_id}', 'communities']
+    return scopes
+
+
+def confessions_changed(confession_ids):
+    """Invalidates pages showing the given confessions, e.g. after vote counts moved."""
+    from .models import Confession
+
+    scopes = {'feed'}
+    for pk, community_id in Confession.objects.filter(pk__in=confession_ids).values_list('pk', 'community_id'):
+        scopes.update(confession_scopes(pk, community_id))
+    bump(*scopes)
@@ -0,0 +1,84 @@
+"""
+Denormalized counters read by list pages instead of per-row ``COUNT(*)``.
+
+``Confession.comment_count``, ``Community.confession_count`` and
+``Community.last_activity_at`` are adjusted with single ``UPDATE``
+statements from the save and delete signals (see ``signals.py``), so they
+commit or roll back with the change that caused them, including cascaded
+deletes. ``recount`` recomputes them from the source tables; run it through
+``manage.py recount`` if they ever drift, e.g. after raw SQL or bulk
+operations that bypass signals. Only approved rows are counted: pending and
+rejected ones are not shown.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Community, Confession
+
+
+def comment_added(comment):
+    Confession.objects.filter(pk=comment.confession_id).update(comment_count=F('comment_count') + 1)
+    Community.objects.filter(confessions=comment.confession_id).update(last_activity_at=comment.created_at)
+
+
+def comment_deleted(comment):
+    Confession.objects.filter(pk=comment.confession_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1,
+    )
+
+
+def confession_added(confession):
+    if confession.community_id:
+        Community.objects.filter(pk=confession.community_id).update(
+            confession_count=F('confession_count') + 1, last_activity_at=confession.created_at,
+        )
+
+
+def confession_deleted(confession):
+    if confession.community_id:
+        Community.objects.filter(pk=confession.community_id, confession_count__gt=0).update(
+            confession_count=F('confession_count') - 1,
+        )
+
+
+def _count(model, field):
+    return (
+        model.objects.filter(**{field: OuterRef('pk')}, status=model.APPROVED)
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+
+
+def _latest(model, field):
+    return (
+        model.objects.filter(**{field: OuterRef('pk')}, status=model.APPROVED)
+        .order_by('-created_at')
+        .values('created_at')[:1]
+    )
+
+
+def recount(confession_ids=None, community_ids=None):
+    """
+    Recomputes the counters from the comment and confession tables.
+    Returns ``(confessions, communities)`` updated.
+    """
+    confessions = Confession.objects.all()
+    if confession_ids is not None:
+        confessions = confessions.filter(pk__in=confession_ids)
+    communities = Community.objects.all()
+    if community_ids is not None:
+        communities = communities.filter(pk__in=community_ids)
+
+    confessions_updated = confessions.update(comment_count=Coalesce(Subquery(_count(Comment, 'confession')), 0))
+    latest_confession = Subquery(_latest(Confession, 'community'))
+    latest_comment = Subquery(_latest(Comment, 'confession__community'))
+    communities_updated = communities.update(
+        confession_count=Coalesce(Subquery(_count(Confession, 'community')), 0),
+        # Greatest() is NULL on some backends if either side is; fall back to the other.
+        last_activity_at=Coalesce(
+            Greatest(latest_confession, latest_comment), latest_confession, latest_comment,
+        ),
+    )
+    return confessions_updated, communities_updated
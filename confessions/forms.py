@@ -1,6 +1,9 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from confizz import passwords
 from .models import Confession, Comment, Community
 
 class CommunityForm(forms.ModelForm):
@@ -36,3 +39,42 @@ class SignUpForm(UserCreationForm):
     class Meta:
         model = User
         fields = ("username", "email", "password1", "password2")
+
+    async def asave(self):
+        """Saves the new user, hashing the password on the hashing pool rather than the event loop."""
+        user = await passwords.run(self.save, commit=False)
+        await user.asave()
+        return user
+
+class LoginForm(AuthenticationForm):
+    """
+    AuthenticationForm for async views: ``await form.ais_valid()`` checks the
+    password with ``aauthenticate``, which hashes off the event loop (see
+    confizz/passwords.py). Plain ``is_valid()`` still authenticates as usual.
+    """
+    _deferred = False
+
+    async def ais_valid(self):
+        self._deferred = True
+        try:
+            if not self.is_valid():
+                return False
+        finally:
+            self._deferred = False
+        self.user_cache = await aauthenticate(
+            self.request, username=self.cleaned_data['username'], password=self.cleaned_data['password'],
+        )
+        try:
+            if self.user_cache is None:
+                raise self.get_invalid_login_error()
+            self.confirm_login_allowed(self.user_cache)
+        except ValidationError as e:
+            self.add_error(None, e)
+            return False
+        return True
+
+    def clean(self):
+        if self._deferred:
+            # The fields alone; ais_valid() authenticates next.
+            return self.cleaned_data
+        return super().clean()
@@ -0,0 +1,200 @@
+"""
+Confession of the day and week, posting streaks and achievements.
+
+Nothing here is aggregated at request time. When a day or an ISO week ends,
+``compute_due`` (run as a periodic job and by ``manage.py
+compute_leaderboards``) ranks the confessions posted in it once and stores
+the top ``LEADERBOARD_SIZE`` in a ``LeaderboardSnapshot``. Closing a day
+also advances every ``Streak``: authors who posted that day extend theirs,
+everyone else's current streak drops to zero. Windows are processed oldest
+first, each exactly once.
+
+Pages read ``current()``: the latest snapshots and streak leaders as plain
+dicts, cached under the ``leaderboards`` stamp until the next window closes.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from confizz import instrumentation
+
+from . import caching, tasks
+from .models import Confession, LeaderboardEntry, LeaderboardSnapshot, Streak
+
+# (code, label, test) for each achievement; they follow from a streak's counters.
+ACHIEVEMENTS = [
+    ('first_confession', 'First confession', lambda streak: streak.active_days >= 1),
+    ('streak_3', '3-day streak', lambda streak: streak.longest >= 3),
+    ('streak_7', 'Week-long streak', lambda streak: streak.longest >= 7),
+    ('streak_30', 'Month-long streak', lambda streak: streak.longest >= 30),
+    ('regular', '30 days of confessions', lambda streak: streak.active_days >= 30),
+    ('confession_of_the_day', 'Confession of the day', lambda streak: streak.wins >= 1),
+]
+
+
+def _bounds(start, days):
+    """The aware datetimes delimiting ``days`` local days from ``start``."""
+    begin = timezone.make_aware(datetime.combine(start, time.min))
+    return begin, timezone.make_aware(datetime.combine(start + timedelta(days=days), time.min))
+
+
+def window_days(kind):
+    return 1 if kind == LeaderboardSnapshot.DAY else 7
+
+
+def closed_windows(kind, today, since):
+    """Starts of the windows of ``kind`` that ended by ``today``, from ``since`` on."""
+    if kind == LeaderboardSnapshot.DAY:
+        start, step = since, timedelta(days=1)
+    else:
+        start, step = since - timedelta(days=since.weekday()), timedelta(days=7)
+    while start + timedelta(days=window_days(kind)) <= today:
+        yield start
+        start += step
+
+
+def top_confessions(start, end, limit):
+    """The ``limit`` best confessions created in [start, end), best first."""
+    weight = getattr(settings, 'RANKING_COMMENT_WEIGHT', 2)
+    return list(
+        Confession.objects.approved().filter(created_at__gte=start, created_at__lt=end)
+        .annotate(score=F('upvotes') + weight * F('comment_count'))
+        .order_by('-score', '-upvotes', 'id')
+        .values('pk', 'author_id', 'score', 'upvotes', 'comment_count')[:limit]
+    )
+
+
+def advance_streaks(day, winner_author_id=None, batch_size=500):
+    """
+    Closes ``day`` for every streak in a few set-based statements: posters
+    extend theirs (or start one), everyone else's current streak resets.
+    """
+    begin, end = _bounds(day, 1)
+    posters = list(
+        Confession.objects.approved().filter(created_at__gte=begin, created_at__lt=end, author__isnull=False)
+        .values_list('author_id', flat=True).distinct()
+    )
+    for start in range(0, len(posters), batch_size):
+        batch = posters[start:start + batch_size]
+        Streak.objects.filter(user_id__in=batch).exclude(last_day=day).update(
+            current=Case(When(last_day=day - timedelta(days=1), then=F('current') + 1), default=Value(1)),
+            active_days=F('active_days') + 1,
+            last_day=day,
+        )
+        existing = set(Streak.objects.filter(user_id__in=batch).values_list('user_id', flat=True))
+        Streak.objects.bulk_create([
+            Streak(user_id=user_id, current=1, longest=1, last_day=day, active_days=1)
+            for user_id in batch if user_id not in existing
+        ])
+    Streak.objects.filter(last_day=day, current__gt=F('longest')).update(longest=F('current'))
+    Streak.objects.filter(current__gt=0, last_day__lt=day).update(current=0)
+    if winner_author_id is not None:
+        # The day's winner was posted that day, so its author has a streak row.
+        Streak.objects.filter(user_id=winner_author_id).update(wins=F('wins') + 1)
+
+
+def compute_window(kind, start):
+    """Snapshots the window of ``kind`` starting on ``start`` (a date)."""
+    days = window_days(kind)
+    begin, end = _bounds(start, days)
+    top = top_confessions(begin, end, getattr(settings, 'LEADERBOARD_SIZE', 5))
+    with transaction.atomic():
+        snapshot = LeaderboardSnapshot.objects.create(kind=kind, start=start, end=start + timedelta(days=days))
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(
+                snapshot=snapshot, rank=rank, confession_id=row['pk'], score=row['score'],
+                upvotes=row['upvotes'], comment_count=row['comment_count'],
+            )
+            for rank, row in enumerate(top, start=1)
+        ])
+        if kind == LeaderboardSnapshot.DAY:
+            advance_streaks(start, top[0]['author_id'] if top else None)
+    return snapshot
+
+
+@tasks.task('compute_leaderboards')
+def compute_due(today=None):
+    """
+    Snapshots every day and week that has ended since the last snapshot of
+    its kind (or within ``LEADERBOARD_BACKFILL_DAYS`` on the first run).
+    """
+    today = today or timezone.localdate()
+    computed = {}
+    for kind in (LeaderboardSnapshot.DAY, LeaderboardSnapshot.WEEK):
+        latest = LeaderboardSnapshot.objects.filter(kind=kind).order_by('-start').first()
+        if latest is not None:
+            since = latest.end
+        else:
+            since = today - timedelta(days=getattr(settings, 'LEADERBOARD_BACKFILL_DAYS', 30))
+        starts = list(closed_windows(kind, today, since))
+        for start in starts:
+            compute_window(kind, start)
+        computed[kind] = len(starts)
+    if any(computed.values()):
+        caching.bump('leaderboards')
+    return computed
+
+
+tasks.periodic('compute_leaderboards', 'LEADERBOARD_INTERVAL')
+
+
+def _snapshot_data(kind):
+    snapshot = LeaderboardSnapshot.objects.filter(kind=kind).order_by('-start').first()
+    if snapshot is None:
+        return None
+    # Confessions moderated away since the snapshot drop out; the rest move up.
+    entries = snapshot.entries.filter(confession__status=Confession.APPROVED).select_related(
+        'confession__community',
+    ).order_by('rank')
+    return {
+        'start': snapshot.start,
+        'end': snapshot.end - timedelta(days=1),
+        'entries': [
+            {
+                'rank': rank,
+                'confession_id': entry.confession_id,
+                'content': entry.confession.content,
+                'community': entry.confession.community.name if entry.confession.community_id else '',
+                'upvotes': entry.upvotes,
+                'comment_count': entry.comment_count,
+            }
+            for rank, entry in enumerate(entries, start=1)
+        ],
+    }
+
+
+def current():
+    """
+    The latest day and week leaderboards and the longest running streaks,
+    as ``{'day': ..., 'week': ..., 'streaks': [...]}``. Served from the
+    cache; a miss reads the snapshot rows and aggregates nothing.
+    """
+    stamp, = caching.get_stamps('leaderboards')
+    key = f'leaderboards:{stamp}'
+    data = cache.get(key)
+    instrumentation.cache_lookup('leaderboards', hits=data is not None, misses=data is None)
+    if data is None:
+        data = {
+            'day': _snapshot_data(LeaderboardSnapshot.DAY),
+            'week': _snapshot_data(LeaderboardSnapshot.WEEK),
+            'streaks': [
+                {'username': username, 'current': current_days, 'longest': longest}
+                for username, current_days, longest in Streak.objects.filter(current__gt=0)
+                .order_by('-current', '-longest').values_list('user__username', 'current', 'longest')
+                [:getattr(settings, 'LEADERBOARD_SIZE', 5)]
+            ],
+        }
+        cache.set(key, data, getattr(settings, 'LEADERBOARD_CACHE_TIMEOUT', 60 * 60 * 24))
+    return data
+
+
+def achievements_for(user):
+    """The user's streak (or None) and the labels of the achievements it has unlocked."""
+    streak = Streak.objects.filter(user=user).first()
+    if streak is None:
+        return None, []
+    return streak, [label for _, label, earned in ACHIEVEMENTS if earned(streak)]
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from confessions import exports
+from confessions.benchmarks import Timer, isolated_database, rss_mb
+from confessions.models import Comment, Confession, Vote
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway database, then measures export_confessions and import_confessions '
+        'throughput in rows/s for each format, with the resident memory before and after.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confessions', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=150000)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    # DEBUG keeps every query's SQL in memory, which would swamp the RSS figures.
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        with isolated_database(), tempfile.TemporaryDirectory() as directory:
+            call_command(
+                'seed_data', confessions=options['confessions'], comments=options['comments'], votes=0,
+                stdout=self.stdout,
+            )
+            rows = Confession.objects.count() + Comment.objects.count()
+            for fmt in exports.FORMATS:
+                path = os.path.join(directory, f'confessions.{fmt}')
+                before = rss_mb()
+                with Timer() as timer, open(path, 'w', encoding='utf-8', newline='') as out:
+                    for line in exports.encode(exports.export_records(chunk_size=options['chunk_size']), fmt):
+                        out.write(line)
+                self.report(f'export {fmt}', rows, timer.elapsed, before, os.path.getsize(path))
+
+                self.clear()
+                before = rss_mb()
+                with Timer() as timer, open(path, encoding='utf-8', newline='') as f:
+                    exports.import_records(exports.decode(f, fmt), batch_size=options['batch_size'])
+                self.report(f'import {fmt}', rows, timer.elapsed, before)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            for model in (Vote, Comment, Confession):
+                cursor.execute(f'DELETE FROM {model._meta.db_table}')
+
+    def report(self, label, rows, elapsed, rss_before, size=None):
+        line = f'{label:<13} {rows:,} rows in {elapsed:.2f}s  {rows / elapsed:>9,.0f} rows/s'
+        if size is not None:
+            line += f'  {size / 2 ** 20:.1f} MiB'
+        self.stdout.write(f'{line}  RSS {rss_before} -> {rss_mb()} MiB')
@@ -0,0 +1,121 @@
+import random
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from confessions import leaderboards
+from confessions.benchmarks import Timer, isolated_database, latency_summary
+from confessions.models import Confession, LeaderboardSnapshot
+
+AGGREGATE = re.compile(r'\b(GROUP BY|COUNT|SUM|MAX|MIN|AVG)\b', re.IGNORECASE)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic dataset (a million confessions by default) in a throwaway database, '
+        'computes the leaderboard snapshots over it and measures the pages that serve them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confessions', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=60, help='Days the confessions are spread over.')
+        parser.add_argument('--page-views', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            with Timer() as timer:
+                self.seed(options)
+            self.stdout.write(f"Seeded {options['confessions']:,} confessions in {timer.elapsed:.1f}s.")
+
+            today = timezone.localdate()
+            with override_settings(LEADERBOARD_BACKFILL_DAYS=options['days']):
+                durations = self.compute(today)
+            self.stdout.write(
+                f"Computed {durations['windows']} snapshots in {durations['total']:.2f}s "
+                f"(per window p50 {durations['latency']['p50_ms']} ms, p95 {durations['latency']['p95_ms']} ms)."
+            )
+
+            start = today - timedelta(days=7 + today.weekday())
+            begin, end = leaderboards._bounds(start, 7)
+            with Timer() as timer:
+                leaderboards.top_confessions(begin, end, 5)
+            self.stdout.write(f'The weekly aggregate alone takes {timer.elapsed * 1000:.1f} ms; pages never run it.')
+
+            self.serve(options)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=f'bench{i}', password=password) for i in range(options['users'])], batch_size=1000,
+        )
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        now = timezone.now()
+        span = options['days'] * 24 * 60 * 60
+        table = Confession._meta.db_table
+        # Raw inserts: bulk_create would stamp every row with the current
+        # time (auto_now_add), and the dataset needs its history.
+        sql = (
+            f'INSERT INTO {table} (content, created_at, upvotes, comment_count, author_id, community_id) '
+            'VALUES (%s, %s, %s, %s, %s, NULL)'
+        )
+        batch = 10000
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(0, options['confessions'], batch):
+                rows = []
+                for i in range(offset, min(offset + batch, options['confessions'])):
+                    rows.append((
+                        f'Synthetic confession {i}',
+                        now - timedelta(seconds=rng.random() * span),
+                        int(rng.paretovariate(1.5)) - 1,
+                        int(rng.paretovariate(2.0)) - 1,
+                        rng.choice(user_ids) if rng.random() < 0.6 else None,
+                    ))
+                cursor.executemany(sql, rows)
+
+    def compute(self, today):
+        latencies = []
+        with Timer() as total:
+            for kind in (LeaderboardSnapshot.DAY, LeaderboardSnapshot.WEEK):
+                since = today - timedelta(days=settings.LEADERBOARD_BACKFILL_DAYS)
+                for start in leaderboards.closed_windows(kind, today, since):
+                    with Timer() as timer:
+                        leaderboards.compute_window(kind, start)
+                    latencies.append(timer.elapsed)
+        return {'windows': len(latencies), 'total': total.elapsed, 'latency': latency_summary(latencies)}
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    def serve(self, options):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries, Timer() as timer:
+            leaderboards.current()
+        self.stdout.write(f'Leaderboards cache miss: {timer.elapsed * 1000:.1f} ms, {len(queries)} queries.')
+
+        client = Client()
+        for name in ('home', 'confessions:confession_list'):
+            url = reverse(name)
+            latencies, aggregates = [], 0
+            for _ in range(options['page_views']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    client.get(url)
+                    latencies.append(time.perf_counter() - started)
+                aggregates += sum(1 for query in queries if AGGREGATE.search(query['sql']))
+            summary = latency_summary(latencies)
+            self.stdout.write(
+                f"{url:<14} p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  "
+                f"p99 {summary['p99_ms']} ms  aggregate queries {aggregates}"
+            )
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate, backends
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.module_loading import import_string
+
+from confizz import passwords
+from confessions.benchmarks import Timer, isolated_database
+
+ALGORITHMS = {'scrypt': 'scrypt', 'argon2': 'argon2', 'pbkdf2': 'pbkdf2_sha256'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures logins per second on one core for each password hashing profile, then how long '
+        '--concurrency simultaneous async logins stall the event loop with Django\'s ModelBackend '
+        'and with confizz.passwords.ModelBackend.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20, help='Logins timed per profile.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--profiles', default=','.join(ALGORITHMS))
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            rates = {}
+            for profile in options['profiles'].split(','):
+                try:
+                    rates[profile] = self.logins_per_second(profile, options['logins'])
+                except ValueError as e:
+                    # Argon2 without argon2-cffi installed.
+                    self.stdout.write(f'{profile:<7} skipped: {e}')
+                    continue
+                self.stdout.write(f'{profile:<7} {rates[profile]:7.1f} logins/s per core')
+            if 'pbkdf2' in rates:
+                for profile, rate in rates.items():
+                    if profile != 'pbkdf2':
+                        self.stdout.write(f'{profile} is {rate / rates["pbkdf2"]:.1f}x the logins of pbkdf2')
+
+            self.stdout.write(f'{settings.PASSWORD_HASHING}, {options["concurrency"]} concurrent async logins:')
+            for label, backend in (('django', backends.ModelBackend()), ('pooled', passwords.ModelBackend())):
+                elapsed, stall = asyncio.run(self.concurrent_logins(backend, options['concurrency']))
+                self.stdout.write(
+                    f'{label:<7} {elapsed * 1000:7.0f} ms total, event loop stalled up to {stall * 1000:6.1f} ms'
+                )
+
+    def hashers(self, profile):
+        algorithm = ALGORITHMS[profile]
+        return sorted(settings.PASSWORD_HASHERS, key=lambda path: import_string(path).algorithm != algorithm)
+
+    def logins_per_second(self, profile, logins):
+        with override_settings(PASSWORD_HASHERS=self.hashers(profile)):
+            User.objects.filter(username='bench').delete()
+            User.objects.create_user(username='bench', password='correct horse battery')
+            with Timer() as timer:
+                for _ in range(logins):
+                    if authenticate(username='bench', password='correct horse battery') is None:
+                        raise RuntimeError('Login failed.')
+        return logins / timer.elapsed
+
+    async def concurrent_logins(self, backend, concurrency):
+        stall = 0.0
+        done = False
+
+        async def ticker():
+            nonlocal stall
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                stall = max(stall, now - last - 0.001)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        with Timer() as timer:
+            users = await asyncio.gather(*(
+                backend.aauthenticate(None, username='bench', password='correct horse battery')
+                for _ in range(concurrency)
+            ))
+        done = True
+        await ticking
+        if None in users:
+            raise RuntimeError('Login failed.')
+        return timer.elapsed, stall
@@ -0,0 +1,102 @@
+import json
+import random
+import re
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from confessions import moderation, summaries
+from confessions.benchmarks import Timer, isolated_database, latency_summary
+from confessions.management.commands.seed_data import WORDS
+from confessions.models import Comment, Confession
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the inline moderation screen in microseconds per post, against checking '
+        'each rule in turn, then the batched review of flagged posts with Gemini replaced by '
+        'a sleep of --upstream-latency seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--words', type=int, default=40, help='Words per post.')
+        parser.add_argument('--flagged', type=float, default=0.05, help='Share of posts that trip a rule.')
+        parser.add_argument('--extra-terms', type=int, default=500, help='Rules added to the defaults.')
+        parser.add_argument('--review-items', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--upstream-latency', type=float, default=0.5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # A realistic blocklist is hundreds of phrases; nonsense words keep them from matching by chance.
+        extra = [f'zq{rng.randrange(10 ** 6)} {rng.choice(WORDS)}' for _ in range(options['extra_terms'])]
+        posts = [self.post(rng, options) for _ in range(options['posts'])]
+
+        with override_settings(MODERATION_TERMS=extra):
+            with Timer() as compile_timer:
+                screen = moderation.get_screen()
+            terms = [term.casefold() for term in moderation.DEFAULT_TERMS + tuple(extra)]
+            patterns = [re.compile(pattern, re.IGNORECASE) for pattern in moderation.DEFAULT_PATTERNS.values()]
+
+            def naive(text):
+                folded = text.casefold()
+                return any(term in folded for term in terms) or any(pattern.search(text) for pattern in patterns)
+
+            self.stdout.write(
+                f'{len(terms)} terms and {len(patterns)} patterns compiled in {compile_timer.elapsed * 1000:.1f} ms'
+            )
+            flagged = self.measure('screen', screen.flagged, posts)
+            self.measure('rule by rule', naive, posts)
+            self.stdout.write(f'{flagged} of {len(posts)} posts flagged')
+
+        self.review(rng, options)
+
+    def post(self, rng, options):
+        words = [rng.choice(WORDS) for _ in range(options['words'])]
+        if rng.random() < options['flagged']:
+            words.insert(rng.randrange(len(words)), rng.choice(moderation.DEFAULT_TERMS))
+        return ' '.join(words).capitalize() + '.'
+
+    def measure(self, label, check, posts):
+        latencies = []
+        flagged = 0
+        for text in posts:
+            started = time.perf_counter()
+            flagged += bool(check(text))
+            latencies.append(time.perf_counter() - started)
+        summary = latency_summary(latencies)
+        self.stdout.write(
+            f"{label:<13} mean {summary['mean_ms'] * 1000:7.1f} us  p99 {summary['p99_ms'] * 1000:7.1f} us per post"
+        )
+        return flagged
+
+    def review(self, rng, options):
+        calls = []
+
+        def slow_generate(text, prompt=summaries.PROMPT):
+            time.sleep(options['upstream_latency'])
+            ids = [json.loads(line)['id'] for line in text.splitlines()]
+            calls.append(len(ids))
+            return '{%s}' % ', '.join(f'"{key}": "{rng.choice(["approve", "reject"])}"' for key in ids)
+
+        with isolated_database():
+            confessions = Confession.objects.bulk_create([
+                Confession(content=f'Flagged confession {i}', status=Confession.PENDING)
+                for i in range(options['review_items'] // 2)
+            ])
+            Comment.objects.bulk_create([
+                Comment(confession=confessions[i % len(confessions)], content=f'Flagged comment {i}',
+                        status=Comment.PENDING)
+                for i in range(options['review_items'] - len(confessions))
+            ])
+            with mock.patch.object(summaries, 'generate', slow_generate), Timer() as timer:
+                totals = moderation.review_pending(batch_size=options['batch_size'], max_batches=10 ** 6)
+        reviewed = totals[Confession.APPROVED] + totals[Confession.REJECTED]
+        self.stdout.write(
+            f'Reviewed {reviewed} items in {len(calls)} calls ({reviewed / max(len(calls), 1):.0f} per call) '
+            f'in {timer.elapsed:.1f}s; one call per item would take {reviewed * options["upstream_latency"]:.1f}s.'
+        )
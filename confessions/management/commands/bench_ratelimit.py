@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from confizz.ratelimit import ratelimit
+from confessions.benchmarks import latency_summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the overhead the rate limiter adds to a request, in microseconds, by timing a '
+        'trivial view with and without @ratelimit against the configured cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--clients', type=int, default=1000, help='Distinct client addresses.')
+        parser.add_argument('--budget-us', type=float, default=100.0)
+
+    def handle(self, *args, **options):
+        def view(request):
+            return HttpResponse()
+
+        factory = RequestFactory()
+        requests = []
+        for i in range(options['requests']):
+            request = factory.post('/', REMOTE_ADDR=f'10.{i % options["clients"] // 256}.{i % 256}.1')
+            request.user = AnonymousUser()
+            requests.append(request)
+
+        # A limit nobody reaches, so every request takes the full path to the view.
+        with override_settings(RATELIMITS={'bench': f'{options["requests"]}/m'}):
+            cache.clear()
+            plain = self.measure(view, requests)
+            limited = self.measure(ratelimit('bench')(view), requests)
+            limited_user = self.measure(ratelimit('bench', key='user')(view), requests)
+        cache.clear()
+
+        self.stdout.write(f"{settings.CACHES['default']['BACKEND']}, {options['clients']} clients")
+        for label, summary in (('no limit', plain), ('by ip', limited), ('by user', limited_user)):
+            self.stdout.write(
+                f"{label:<9} mean {summary['mean_ms'] * 1000:6.1f} us  p99 {summary['p99_ms'] * 1000:6.1f} us"
+            )
+        overhead = (limited['mean_ms'] - plain['mean_ms']) * 1000
+        style = self.style.SUCCESS if overhead < options['budget_us'] else self.style.ERROR
+        self.stdout.write(style(f'Overhead {overhead:.1f} us per request (budget {options["budget_us"]:.0f} us).'))
+
+    def measure(self, view, requests):
+        latencies = []
+        for request in requests:
+            started = time.perf_counter()
+            view(request)
+            latencies.append(time.perf_counter() - started)
+        return latency_summary(latencies)
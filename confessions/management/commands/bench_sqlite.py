@@ -0,0 +1,138 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from confessions.benchmarks import latency_summary
+
+SCHEMA = [
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, created_at REAL NOT NULL, body TEXT NOT NULL, comments INTEGER NOT NULL)',
+    'CREATE INDEX post_feed_idx ON post (created_at DESC, id DESC)',
+]
+FEED_QUERY = 'SELECT id, body, comments FROM post WHERE created_at < ? ORDER BY created_at DESC, id DESC LIMIT 20'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares concurrent feed reads and comment-style writes on SQLite with Django's "
+        'default connection settings and with the DATABASE_PROFILE=production settings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile.')
+        parser.add_argument('--rows', type=int, default=20000, help='Rows seeded before the run.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        profiles = {
+            # What Django does without OPTIONS: rollback journal, a 5 second
+            # busy timeout, deferred transactions and a connection per request.
+            'default': {'pragmas': [], 'timeout': 5.0, 'begin': 'BEGIN', 'persistent': False},
+            'production': {
+                'pragmas': settings.SQLITE_PRAGMAS,
+                'timeout': settings.SQLITE_BUSY_TIMEOUT,
+                'begin': 'BEGIN IMMEDIATE',
+                'persistent': True,
+            },
+        }
+        results = {}
+        for name, profile in profiles.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, profile, options['rows'])
+                results[name] = self.run(path, profile, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<11} reads {result['reads_per_second']:9.1f}/s (p95 {result['read_latency']['p95_ms']} ms)  "
+                f"writes {result['writes_per_second']:8.1f}/s (p95 {result['write_latency']['p95_ms']} ms)  "
+                f"locked errors {result['errors']}"
+            )
+
+    def connect(self, path, profile):
+        conn = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None, check_same_thread=False)
+        for pragma in profile['pragmas']:
+            conn.execute(pragma)
+        return conn
+
+    def seed(self, path, profile, rows):
+        conn = self.connect(path, profile)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        now = time.time()
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO post (created_at, body, comments) VALUES (?, ?, 0)',
+            ((now - i, f'Seed confession {i}') for i in range(rows)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def run(self, path, profile, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'read': [], 'write': [], 'errors': 0}
+
+        def worker(operation):
+            conn = self.connect(path, profile) if profile['persistent'] else None
+            rng = random.Random()
+            latencies = []
+            errors = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                db = conn or self.connect(path, profile)
+                try:
+                    operation(db, rng)
+                    latencies.append(time.perf_counter() - started)
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+                finally:
+                    if conn is None:
+                        db.close()
+            if conn is not None:
+                conn.close()
+            with lock:
+                stats['read' if operation is read else 'write'].extend(latencies)
+                stats['errors'] += errors
+
+        def read(db, rng):
+            db.execute(FEED_QUERY, (time.time() - rng.random() * options['rows'],)).fetchall()
+
+        def write(db, rng):
+            # Read-then-write, like an ORM save inside transaction.atomic().
+            db.execute(profile['begin'])
+            post_id = rng.randint(1, options['rows'])
+            db.execute('SELECT comments FROM post WHERE id = ?', (post_id,)).fetchone()
+            db.execute('INSERT INTO post (created_at, body, comments) VALUES (?, ?, 0)', (time.time(), 'New confession'))
+            db.execute('UPDATE post SET comments = comments + 1 WHERE id = ?', (post_id,))
+            db.execute('COMMIT')
+
+        threads = [threading.Thread(target=worker, args=(read,)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(write,)) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'reads_per_second': len(stats['read']) / options['duration'],
+            'writes_per_second': len(stats['write']) / options['duration'],
+            'errors': stats['errors'],
+            'read_latency': latency_summary(stats['read']),
+            'write_latency': latency_summary(stats['write']),
+        }
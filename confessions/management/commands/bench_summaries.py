@@ -0,0 +1,85 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from confessions import summaries
+from confessions.benchmarks import Timer, isolated_database, latency_summary
+from confessions.models import Comment, Confession
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures feed page-view throughput on the ASGI stack with and without AI summaries '
+        'in flight. Gemini is replaced by a sleep of --upstream-latency seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-views', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--summaries', type=int, default=8, help='Summaries in flight during the loaded run.')
+        parser.add_argument('--upstream-latency', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            # One confession per in-flight summary so the requests are not coalesced.
+            confessions = [
+                Confession.objects.create(content=f'Benchmark confession {i}')
+                for i in range(options['summaries'])
+            ]
+            Comment.objects.bulk_create([
+                Comment(confession=confession, content=f'Comment {i}')
+                for confession in confessions for i in range(20)
+            ])
+            cache.clear()
+
+            def slow_generate(text, prompt=summaries.PROMPT):
+                time.sleep(options['upstream_latency'])
+                return 'Benchmark summary.'
+
+            # Background summaries never run in the web process; measure the inline path.
+            with mock.patch.object(summaries, 'generate', slow_generate), override_settings(SUMMARY_BACKGROUND=False):
+                results = asyncio.run(self.run_benchmark([c.pk for c in confessions], options))
+
+        baseline, loaded, outcomes = results
+        self.stdout.write(f"Page views alone:          {baseline['rps']:8.1f} req/s  p95 {baseline['latency']['p95_ms']} ms")
+        self.stdout.write(f"Page views with summaries: {loaded['rps']:8.1f} req/s  p95 {loaded['latency']['p95_ms']} ms")
+        self.stdout.write(f"Summary responses: {outcomes}")
+        ratio = loaded['rps'] / baseline['rps'] if baseline['rps'] else 0
+        self.stdout.write(self.style.SUCCESS(f'Throughput held at {ratio:.0%} of baseline while summaries were in flight.'))
+
+    async def page_views(self, client, count, concurrency):
+        url = reverse('confessions:confession_list')
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                await client.get(url)
+                latencies.append(time.perf_counter() - started)
+
+        with Timer() as timer:
+            await asyncio.gather(*(one() for _ in range(count)))
+        return {'rps': count / timer.elapsed, 'latency': latency_summary(latencies)}
+
+    async def run_benchmark(self, confession_ids, options):
+        client = AsyncClient()
+        baseline = await self.page_views(client, options['page_views'], options['concurrency'])
+
+        in_flight = [
+            asyncio.create_task(client.post(reverse('confessions:summarize_comments', kwargs={'pk': pk})))
+            for pk in confession_ids
+        ]
+        await asyncio.sleep(0.05)
+        loaded = await self.page_views(client, options['page_views'], options['concurrency'])
+        responses = await asyncio.gather(*in_flight)
+
+        outcomes = {}
+        for response in responses:
+            outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+        return baseline, loaded, outcomes
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from confessions import leaderboards
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshots the confession of the day and week for every window that has ended '
+        'and advances posting streaks (normally done by the compute_leaderboards job).'
+    )
+
+    def handle(self, *args, **options):
+        computed = leaderboards.compute_due()
+        self.stdout.write(self.style.SUCCESS(
+            f"Computed {computed['day']} daily and {computed['week']} weekly leaderboards."
+        ))
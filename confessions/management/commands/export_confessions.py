@@ -0,0 +1,92 @@
+import json
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from confessions import exports
+from confessions.benchmarks import Timer
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams confessions and their comments out as NDJSON or CSV in confession id order. '
+        'With --checkpoint, progress is saved every chunk and a rerun resumes where the last run stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+        parser.add_argument('--format', choices=exports.FORMATS, help='Default: from the file extension, else ndjson.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Confessions read per round trip.')
+        parser.add_argument('--after-id', type=int, default=0, help='Only export confessions with a larger id.')
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the last exported id and output size; if it exists the export resumes from it.',
+        )
+
+    def handle(self, *args, **options):
+        output, checkpoint = options['output'], options['checkpoint']
+        if checkpoint and not output:
+            raise CommandError('--checkpoint needs --output.')
+        fmt = options['format'] or (exports.format_for(output) if output else 'ndjson')
+
+        after_id, offset = options['after_id'], 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            after_id, offset = state['after_id'], state['offset']
+            self.stderr.write(f'Resuming after confession {after_id}.')
+
+        self.counts = {'confessions': 0, 'comments': 0}
+        records = exports.export_records(after_id=after_id, chunk_size=options['chunk_size'])
+        with Timer() as timer:
+            if output is None:
+                for line in exports.encode(records, fmt):
+                    self.stdout.write(line, ending='')
+            else:
+                with open(output, 'r+b' if offset else 'wb') as out:
+                    # Drop anything written after the checkpoint by a run that died.
+                    out.seek(offset)
+                    out.truncate()
+                    records = self.checkpointed(records, out, checkpoint, after_id, options['chunk_size'])
+                    lines = exports.encode(records, fmt)
+                    if offset and fmt == 'csv':
+                        lines = islice(lines, 1, None)
+                    for line in lines:
+                        out.write(line.encode())
+
+        rows = self.counts['confessions'] + self.counts['comments']
+        self.stderr.write(
+            f"Exported {self.counts['confessions']} confessions and {self.counts['comments']} comments "
+            f'in {timer.elapsed:.1f}s ({rows / max(timer.elapsed, 1e-9):,.0f} rows/s).'
+        )
+
+    def checkpointed(self, records, out, checkpoint, last_id, every):
+        """
+        Passes ``records`` through, counting them and saving a checkpoint
+        every ``every`` confessions. Records are pulled lazily, so when the
+        next confession is asked for, everything before it is written.
+        """
+        pending = 0
+        for record in records:
+            if record['type'] == 'confession':
+                if checkpoint and pending >= every:
+                    self.save_checkpoint(out, checkpoint, last_id)
+                    pending = 0
+                last_id = record['id']
+                pending += 1
+                self.counts['confessions'] += 1
+            else:
+                self.counts['comments'] += 1
+            yield record
+        if checkpoint:
+            # Written out by the time the encoder asks past the last record.
+            self.save_checkpoint(out, checkpoint, last_id)
+
+    def save_checkpoint(self, out, checkpoint, last_id):
+        out.flush()
+        os.fsync(out.fileno())
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'after_id': last_id, 'offset': out.tell()}, f)
+        os.replace(temporary, checkpoint)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from confessions import caching, exports
+from confessions.benchmarks import Timer
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads an export_confessions file (NDJSON or CSV) with bulk_create in batches. Rows get new '
+        'ids, and comments follow their confession; loading a file twice loads it twice.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=exports.FORMATS, help='Default: from the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or exports.format_for(options['path'])
+        with Timer() as timer, open(options['path'], encoding='utf-8', newline='') as f:
+            totals = exports.import_records(exports.decode(f, fmt), batch_size=options['batch_size'])
+
+        # Rows inserted in bulk skip the signals that invalidate cached pages.
+        caching.bump('feed', 'communities', 'cards', 'rankings', 'leaderboards')
+        rows = totals['confessions'] + totals['comments']
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['confessions']} confessions and {totals['comments']} comments "
+            f'in {timer.elapsed:.1f}s ({rows / max(timer.elapsed, 1e-9):,.0f} rows/s).'
+        ))
+        if totals['unresolved']:
+            self.stdout.write(self.style.WARNING(
+                f"{totals['unresolved']} authors or communities were not found and were left empty."
+            ))
+        if totals['orphaned']:
+            self.stdout.write(self.style.WARNING(
+                f"{totals['orphaned']} comments were skipped because their confession is not in the file."
+            ))
@@ -0,0 +1,207 @@
+import json
+import platform
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from confessions.benchmarks import compare_results, isolated_database, latency_summary, peak_rss_mb, rss_mb
+from confessions.models import Community, Confession
+
+
+def default_endpoints():
+    """The main read endpoints, resolved against whatever data the database holds."""
+    endpoints = {
+        'home': reverse('home'),
+        'feed': reverse('confessions:confession_list'),
+        'feed_json': reverse('confessions:confession_feed'),
+        'hot': reverse('confessions:confession_list') + '?sort=hot',
+        'search': reverse('confessions:search_confessions') + '?q=coffee',
+        'communities': reverse('community-list'),
+    }
+    community = Community.objects.order_by('-confession_count').first()
+    if community is not None:
+        endpoints['community'] = reverse('community-detail', kwargs={'slug': community.slug})
+    busiest = Confession.objects.aggregate(most=Max('comment_count'))['most']
+    confession = Confession.objects.filter(comment_count=busiest).first() if busiest is not None else None
+    if confession is not None:
+        endpoints['comments'] = reverse('confessions:confession_comments', kwargs={'pk': confession.pk})
+    return endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives the main endpoints at a fixed concurrency, in process through the test client or '
+        'against a running server with --base-url, and reports p50/p95/p99 latency, queries per '
+        'request and RSS. Results can be saved as a baseline and later runs compared against it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per endpoint first.')
+        parser.add_argument('--endpoints', help='Comma separated subset of endpoint names.')
+        parser.add_argument('--base-url', help='Load a running server over HTTP instead of the test client.')
+        parser.add_argument('--server-pid', type=int, help='Process whose RSS to report in --base-url mode.')
+        parser.add_argument('--no-page-cache', action='store_true', help='Disable the anonymous page cache.')
+        parser.add_argument(
+            '--isolated', action='store_true',
+            help='Run against a throwaway database filled by seed_data (use --seed-* to size it).',
+        )
+        parser.add_argument('--seed-confessions', type=int, default=5000)
+        parser.add_argument('--seed-users', type=int, default=500)
+        parser.add_argument('--save', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Baseline JSON file to diff the results against.')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Latency growth counted as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['base_url'] and options['isolated']:
+            raise CommandError('--isolated seeds an in-process database; it cannot be combined with --base-url.')
+        settings_override = override_settings(PAGE_CACHE_ENABLED=False) if options['no_page_cache'] else nullcontext()
+        database = isolated_database() if options['isolated'] else nullcontext()
+        with database, settings_override:
+            if options['isolated']:
+                call_command(
+                    'seed_data', users=options['seed_users'], confessions=options['seed_confessions'],
+                    comments=options['seed_confessions'] * 3, votes=options['seed_confessions'] * 5,
+                    communities=20, stdout=self.stdout,
+                )
+            results = self.run(options)
+
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}.")
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = self.report_comparison(compare_results(baseline, results, options['threshold']))
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} regression(s) against {options["compare"]}.')
+
+    def run(self, options):
+        endpoints = default_endpoints()
+        if options['endpoints']:
+            wanted = [name.strip() for name in options['endpoints'].split(',')]
+            unknown = set(wanted) - set(endpoints)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}. Known: {', '.join(endpoints)}.")
+            endpoints = {name: endpoints[name] for name in wanted}
+
+        fetch = self.http_fetch(options['base_url']) if options['base_url'] else self.client_fetch()
+        rss_pid = options['server_pid'] if options['base_url'] else None
+        rss_start = rss_mb(rss_pid)
+        results = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'mode': 'http' if options['base_url'] else 'client',
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'page_cache': not options['no_page_cache'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'endpoints': {},
+        }
+        for name, path in endpoints.items():
+            for _ in range(options['warmup']):
+                fetch(path)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                samples = list(pool.map(fetch, [path] * options['requests']))
+            elapsed = time.perf_counter() - started
+            queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+            statuses = {}
+            for sample in samples:
+                statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+            results['endpoints'][name] = {
+                'path': path,
+                'rps': round(len(samples) / elapsed, 1),
+                'latency': latency_summary([sample['seconds'] for sample in samples]),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+                'max_queries': max(queries) if queries else None,
+                'statuses': statuses,
+                'cache_hits': sum(1 for sample in samples if sample['cache'] == 'hit'),
+            }
+        results['rss'] = {
+            'start_mb': rss_start,
+            'end_mb': rss_mb(rss_pid),
+            'peak_mb': peak_rss_mb() if rss_pid is None else None,
+        }
+        return results
+
+    def client_fetch(self):
+        local = threading.local()
+
+        def fetch(path):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                response = local.client.get(path)
+                seconds = time.perf_counter() - started
+            return {
+                'seconds': seconds,
+                'status': response.status_code,
+                'queries': sum(len(context) for context in captured),
+                'cache': response.get('X-Page-Cache'),
+            }
+        return fetch
+
+    def http_fetch(self, base_url):
+        base_url = base_url.rstrip('/')
+
+        def fetch(path):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=30) as response:
+                    response.read()
+                    status, cache = response.status, response.headers.get('X-Page-Cache')
+            except urllib.error.HTTPError as e:
+                status, cache = e.code, None
+            except urllib.error.URLError:
+                status, cache = 'error', None
+            return {'seconds': time.perf_counter() - started, 'status': status, 'queries': None, 'cache': cache}
+        return fetch
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'endpoint':<12} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}  statuses"
+        )
+        for name, result in results['endpoints'].items():
+            latency = result['latency']
+            queries = '-' if result['queries_per_request'] is None else f"{result['queries_per_request']:.1f}"
+            self.stdout.write(
+                f"{name:<12} {result['rps']:>8} {latency['p50_ms']:>9} {latency['p95_ms']:>9} "
+                f"{latency['p99_ms']:>9} {queries:>8}  {result['statuses']}"
+            )
+        rss = results['rss']
+        self.stdout.write(f"RSS: {rss['start_mb']} MiB at start, {rss['end_mb']} MiB at end, peak {rss['peak_mb']} MiB.")
+
+    def report_comparison(self, rows):
+        regressions = 0
+        for row in rows:
+            if row['regression']:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(
+                    f"REGRESSION {row['endpoint']} {row['metric']}: {row['baseline']} -> {row['current']} "
+                    f"({row['change']:+.0%})"
+                ))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f'No regressions across {len(rows)} compared metrics.'))
+        return regressions
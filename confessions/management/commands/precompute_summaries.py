@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from confessions import summaries
+
+
+class Command(BaseCommand):
+    help = 'Queues AI summaries for the most commented recent confessions that lack a current one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None, help='Confessions to cover (default: SUMMARY_PRECOMPUTE_TOP).')
+        parser.add_argument('--window', type=int, default=None, help='Activity window in seconds (default: SUMMARY_PRECOMPUTE_WINDOW).')
+
+    def handle(self, *args, **options):
+        result = summaries.precompute(options['top'], options['window'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {result['queued']} of {result['hot']} hot confessions for summarising."
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from confessions.search import get_search_backend, install_sqlite_schema
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index for confessions and comments from scratch.'
+
+    def handle(self, *args, **options):
+        install_sqlite_schema()
+        backend = get_search_backend()
+        started = time.perf_counter()
+        indexed = backend.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} rows with {type(backend).__name__} in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from confessions import votes
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes confession upvote counters from the vote ledger. Votes still buffered in running web '
+        'processes are counted twice, so stop them first; the reconcile_votes job repairs drift while they run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'confession_ids', nargs='*', type=int,
+            help='Only reconcile these confessions (default: all).',
+        )
+
+    def handle(self, *args, **options):
+        updated = votes.reconcile(options['confession_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled upvotes on {updated} confessions.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from confessions import counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized comment and confession counters from the source tables.'
+
+    def handle(self, *args, **options):
+        confessions, communities = counters.recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {confessions} confessions and {communities} communities.'
+        ))
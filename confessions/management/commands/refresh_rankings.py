@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from confessions import rankings
+
+
+class Command(BaseCommand):
+    help = 'Brings the Hot and Top feed rankings up to date (normally done by the refresh_rankings job).'
+
+    def handle(self, *args, **options):
+        result = rankings.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {result['updated']} ranking rows and removed {result['removed']}."
+        ))
@@ -0,0 +1,57 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from confessions import tasks
+
+
+def _work(options):
+    worker = tasks.Worker(poll_interval=options['poll_interval'], batch_size=options['batch_size'])
+    worker.run(max_jobs=options['max_jobs'])
+
+
+class Command(BaseCommand):
+    help = 'Starts background job workers (AI summaries and other queued work) and runs until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes to start.')
+        parser.add_argument('--batch-size', type=int, default=1, help='Jobs claimed per poll.')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after running this many jobs.')
+        parser.add_argument('--burst', action='store_true', help='Run the jobs that are due, then exit.')
+
+    def handle(self, *args, **options):
+        if options['burst']:
+            ran = tasks.run_pending(limit=options['max_jobs'] or 10_000)
+            self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs.'))
+            return
+        if options['workers'] <= 1:
+            _work(options)
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=_work, args=(options,), name=f'worker-{i}', daemon=True)
+            for i in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} workers: {', '.join(str(p.pid) for p in processes)}")
+
+        def shutdown(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            shutdown()
+            for process in processes:
+                process.join()
@@ -0,0 +1,154 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from confessions import caching
+from confessions.benchmarks import Timer
+from confessions.exports import historical_timestamps
+from confessions.models import Comment, Community, Confession, Vote
+
+WORDS = (
+    'secretly love hate exam roommate coffee midnight professor crush library lecture deadline '
+    'party dorm pizza sleep gym friend group chat ghosted internship code bug sorry honestly '
+    'never told anyone weekend campus rain playlist nervous proud lonely laughed cried'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-seeds synthetic users, communities, confessions, comments and votes with '
+        'bulk_create in batches. Counters are filled in as rows are generated.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--communities', type=int, default=50)
+        parser.add_argument('--confessions', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=60000, help='Total comments across all confessions.')
+        parser.add_argument('--votes', type=int, default=100000, help='Total upvotes across all confessions.')
+        parser.add_argument('--days', type=int, default=90, help='Days of history the rows are spread over.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable datasets.')
+        parser.add_argument('--prefix', default='seed', help='Prefix for generated usernames and community names.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.days = options['days']
+        self.batch_size = options['batch_size']
+        totals = {'comments': 0, 'votes': 0}
+
+        with Timer() as timer, historical_timestamps(Confession, Comment, Vote, Community):
+            user_ids = self.seed_users(options)
+            communities = self.seed_communities(options, user_ids)
+            activity = {community.pk: (0, None) for community in communities}
+
+            remaining = {'comments': options['comments'], 'votes': options['votes']}
+            for start in range(0, options['confessions'], self.batch_size):
+                count = min(self.batch_size, options['confessions'] - start)
+                share = count / (options['confessions'] - start)
+                with transaction.atomic():
+                    confessions = self.seed_confessions(
+                        count, options, user_ids, communities,
+                        comments=round(remaining['comments'] * share), votes=round(remaining['votes'] * share),
+                    )
+                    totals['comments'] += self.seed_comments(confessions, user_ids)
+                    totals['votes'] += self.seed_votes(confessions, user_ids)
+                remaining['comments'] -= sum(confession.comment_count for confession in confessions)
+                remaining['votes'] -= sum(confession.upvotes for confession in confessions)
+                for confession in confessions:
+                    if confession.community_id:
+                        confession_count, last = activity[confession.community_id]
+                        latest = max(filter(None, [last, confession.created_at, *confession.comment_times]))
+                        activity[confession.community_id] = (confession_count + 1, latest)
+
+            for community in communities:
+                community.confession_count, community.last_activity_at = activity[community.pk]
+            Community.objects.bulk_update(communities, ['confession_count', 'last_activity_at'], batch_size=500)
+
+        # Rows inserted in bulk skip the signals that invalidate cached pages.
+        caching.bump('feed', 'communities', 'cards', 'rankings', 'leaderboards')
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users, {len(communities)} communities, {options['confessions']} confessions, "
+            f"{totals['comments']} comments and {totals['votes']} votes in {timer.elapsed:.1f}s."
+        ))
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    def moment(self, after=None):
+        """A random time in the seeded history (after ``after``, if given)."""
+        earliest = after or self.now - timedelta(days=self.days)
+        return earliest + (self.now - earliest) * self.rng.random()
+
+    def seed_users(self, options):
+        offset = User.objects.count()
+        # Seeded accounts cannot log in, and skip hashing a password per row.
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            [User(username=f"{options['prefix']}{offset + i}", password=password) for i in range(options['users'])],
+            batch_size=self.batch_size,
+        )
+        return [user.pk for user in users]
+
+    def seed_communities(self, options, user_ids):
+        offset = Community.objects.count()
+        communities = []
+        for i in range(options['communities']):
+            name = f"{options['prefix']} community {offset + i}"
+            communities.append(Community(
+                name=name, slug=slugify(name), description=self.sentence(12),
+                created_by_id=self.rng.choice(user_ids), created_at=self.moment(),
+            ))
+        return Community.objects.bulk_create(communities, batch_size=self.batch_size)
+
+    def spread(self, total, count, cap=None):
+        """Splits ``total`` over ``count`` rows with a long tail, at most ``cap`` each."""
+        weights = [self.rng.paretovariate(1.2) for _ in range(count)]
+        counts = [0] * count
+        for index in self.rng.choices(range(count), weights=weights, k=total):
+            if cap is None or counts[index] < cap:
+                counts[index] += 1
+        return counts
+
+    def seed_confessions(self, count, options, user_ids, communities, comments, votes):
+        comment_counts = self.spread(comments, count)
+        vote_counts = self.spread(votes, count, cap=len(user_ids))
+        confessions = []
+        for comment_count, upvotes in zip(comment_counts, vote_counts):
+            confession = Confession(
+                content=self.sentence(self.rng.randint(6, 40)),
+                created_at=self.moment(),
+                author_id=self.rng.choice(user_ids) if user_ids and self.rng.random() < 0.6 else None,
+                community=self.rng.choice(communities) if communities and self.rng.random() < 0.5 else None,
+                comment_count=comment_count,
+                upvotes=upvotes,
+            )
+            confession.comment_times = sorted(self.moment(confession.created_at) for _ in range(comment_count))
+            confessions.append(confession)
+        return Confession.objects.bulk_create(confessions)
+
+    def seed_comments(self, confessions, user_ids):
+        comments = [
+            Comment(
+                confession_id=confession.pk, content=self.sentence(self.rng.randint(3, 20)), created_at=created_at,
+                author_id=self.rng.choice(user_ids) if user_ids and self.rng.random() < 0.5 else None,
+            )
+            for confession in confessions for created_at in confession.comment_times
+        ]
+        Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+        return len(comments)
+
+    def seed_votes(self, confessions, user_ids):
+        votes = [
+            Vote(confession_id=confession.pk, user_id=user_id, created_at=self.moment(confession.created_at))
+            for confession in confessions for user_id in self.rng.sample(user_ids, confession.upvotes)
+        ]
+        Vote.objects.bulk_create(votes, batch_size=self.batch_size)
+        return len(votes)
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from confizz.databases import sqlite_path, sync_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the SQLite primary over each SQLite read replica (DATABASE_REPLICAS) '
+        'with the online backup API. Postgres replicas are fed by streaming replication instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Keep syncing every N seconds.')
+        parser.add_argument('--pages', type=int, default=1024, help='Pages copied per backup step.')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('sync_replica only copies a SQLite primary.')
+        targets = [
+            sqlite_path(settings.DATABASES[alias])
+            for alias in settings.READ_REPLICAS
+            if settings.DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3'
+            and sqlite_path(settings.DATABASES[alias]) != sqlite_path(primary)
+        ]
+        if not targets:
+            raise CommandError('No SQLite replicas are configured; set DATABASE_REPLICAS.')
+
+        while True:
+            for target in targets:
+                started = time.perf_counter()
+                sync_sqlite(sqlite_path(primary), target, pages=options['pages'])
+                self.stdout.write(f'Synced {target} in {time.perf_counter() - started:.2f}s.')
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
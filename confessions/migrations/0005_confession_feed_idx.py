@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0004_community_slug'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='confession',
+            index=models.Index(fields=['-created_at', '-id'], name='confession_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+from django.db import migrations
+
+# The schema as this migration installed it, copied from confessions.search
+# so later changes there don't rewrite history. search.install_sqlite_schema
+# re-creates missing triggers after every migrate from the live definitions.
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS confessions_search USING fts5(
+        content, tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS confessions_comment_search USING fts5(
+        content, confession_id UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_confession_insert
+    AFTER INSERT ON confessions_confession BEGIN
+        INSERT INTO confessions_search(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_confession_update
+    AFTER UPDATE OF content ON confessions_confession BEGIN
+        UPDATE confessions_search SET content = new.content WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_confession_delete
+    AFTER DELETE ON confessions_confession BEGIN
+        DELETE FROM confessions_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_comment_insert
+    AFTER INSERT ON confessions_comment BEGIN
+        INSERT INTO confessions_comment_search(rowid, content, confession_id)
+        VALUES (new.id, new.content, new.confession_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_comment_update
+    AFTER UPDATE OF content, confession_id ON confessions_comment BEGIN
+        UPDATE confessions_comment_search SET content = new.content, confession_id = new.confession_id
+        WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_comment_delete
+    AFTER DELETE ON confessions_comment BEGIN
+        DELETE FROM confessions_comment_search WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS confessions_search_confession_insert',
+    'DROP TRIGGER IF EXISTS confessions_search_confession_update',
+    'DROP TRIGGER IF EXISTS confessions_search_confession_delete',
+    'DROP TRIGGER IF EXISTS confessions_search_comment_insert',
+    'DROP TRIGGER IF EXISTS confessions_search_comment_update',
+    'DROP TRIGGER IF EXISTS confessions_search_comment_delete',
+    'DROP TABLE IF EXISTS confessions_search',
+    'DROP TABLE IF EXISTS confessions_comment_search',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_SCHEMA:
+        schema_editor.execute(statement)
+    # Index rows that existed before the triggers were installed.
+    schema_editor.execute('INSERT INTO confessions_search(rowid, content) SELECT id, content FROM confessions_confession')
+    schema_editor.execute(
+        'INSERT INTO confessions_comment_search(rowid, content, confession_id) '
+        'SELECT id, content, confession_id FROM confessions_comment'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_DROP:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0005_confession_feed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0006_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(blank=True, max_length=40, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('confession', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='confessions.confession')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('confession', 'user'), name='unique_user_vote'), models.UniqueConstraint(condition=models.Q(('session_key__isnull', False)), fields=('confession', 'session_key'), name='unique_session_vote'), models.CheckConstraint(condition=models.Q(('user__isnull', False), ('session_key__isnull', False), _connector='OR'), name='vote_has_voter')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0007_vote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('summary', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('confession', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='confessions.confession')),
+            ],
+        ),
+    ]
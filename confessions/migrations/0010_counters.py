@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:25
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def fill_counters(apps, schema_editor):
+    Community = apps.get_model('confessions', 'Community')
+    Confession = apps.get_model('confessions', 'Confession')
+    Comment = apps.get_model('confessions', 'Comment')
+
+    def per_parent(queryset, field, aggregate):
+        return Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+            .annotate(value=aggregate).values('value')
+        )
+
+    Confession.objects.update(comment_count=Coalesce(per_parent(Comment.objects, 'confession', Count('pk')), 0))
+    latest_confession = per_parent(Confession.objects, 'community', Max('created_at'))
+    latest_comment = per_parent(Comment.objects, 'confession__community', Max('created_at'))
+    Community.objects.update(
+        confession_count=Coalesce(per_parent(Confession.objects, 'community', Count('pk')), 0),
+        last_activity_at=Coalesce(Greatest(latest_confession, latest_comment), latest_confession, latest_comment),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='confession_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='confession',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
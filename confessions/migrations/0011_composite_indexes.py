@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0010_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Build the composite indexes before dropping the single-column ones they replace.
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['confession', '-created_at', '-id'], name='comment_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='confession',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='confession_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='confession',
+            index=models.Index(fields=['community', '-created_at', '-id'], name='confession_community_idx'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='confession',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='confessions.confession'),
+        ),
+        migrations.AlterField(
+            model_name='confession',
+            name='author',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='confession',
+            name='community',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='confessions', to='confessions.community'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0011_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ranking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hot', 'Hot'), ('day', 'Top today'), ('week', 'Top this week'), ('month', 'Top this month')], max_length=5)),
+                ('created_at', models.DateTimeField()),
+                ('score', models.FloatField()),
+                ('upvotes', models.IntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('community', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='confessions.community')),
+                ('confession', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='confessions.confession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', '-score', '-confession'], name='ranking_feed_idx'), models.Index(fields=['period', 'community', '-score', '-confession'], name='ranking_community_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'confession'), name='unique_ranking')],
+            },
+        ),
+    ]
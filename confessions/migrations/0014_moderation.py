@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confessions', '0013_leaderboards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_thread_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='confession',
+            name='confession_feed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='confession',
+            name='confession_community_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending review'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='approved', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='confession',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending review'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='approved', max_length=8),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['confession', 'status', '-created_at', '-id'], name='comment_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='comment_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='confession',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='confession_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='confession',
+            index=models.Index(fields=['community', 'status', '-created_at', '-id'], name='confession_community_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models import Prefetch, Q
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 
 class Community(models.Model):
@@ -10,6 +12,9 @@ class Community(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by signals (see counters.py); `manage.py recount` repairs drift.
+    confession_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -19,22 +24,278 @@ class Community(models.Model):
     def __str__(self):
         return self.name
 
-class Confession(models.Model):
+class Moderated(models.Model):
+    """
+    A moderation status for user-written content. Posts that pass the
+    inline screen are approved on creation; flagged ones wait as pending
+    for review (see moderation.py). Public pages show approved rows only.
+    """
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending review'),
+        (APPROVED, 'Approved'),
+        (REJECTED, 'Rejected'),
+    ]
+
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=APPROVED)
+    # Set when an automatic review left the post undecided; it then waits for the admin.
+    reviewed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+
+class ConfessionQuerySet(models.QuerySet):
+    def approved(self):
+        return self.filter(status=Confession.APPROVED)
+
+    def for_feed(self, recent_comments=0):
+        """
+        Loads everything a feed card renders in a fixed number of queries:
+        the author and community are joined and the comment count is read
+        off the row. Comment threads are fetched on demand from the comments
+        endpoint; pass ``recent_comments`` to prefetch that many of the
+        newest comments (with their authors) in one bounded query as
+        ``recent_comments``.
+        """
+        queryset = self.select_related('author', 'community')
+        if recent_comments:
+            queryset = queryset.prefetch_related(Prefetch(
+                'comments',
+                queryset=(
+                    Comment.objects.filter(status=Comment.APPROVED).select_related('author')
+                    .order_by('-created_at', '-id')[:recent_comments]
+                ),
+                to_attr='recent_comments',
+            ))
+        return queryset
+
+
+class Confession(Moderated):
     """Model representing a user confession with optional anonymity."""
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     upvotes = models.IntegerField(default=0)
-    author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)  # Optional for anonymous
-    community = models.ForeignKey(Community, on_delete=models.CASCADE, null=True, blank=True, related_name='confessions')
+    comment_count = models.PositiveIntegerField(default=0)
+    # The composite indexes below lead with these columns and serve their lookups.
+    author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)  # Optional for anonymous
+    community = models.ForeignKey(
+        Community, on_delete=models.CASCADE, null=True, blank=True, related_name='confessions', db_index=False,
+    )
+
+    objects = ConfessionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs the keyset-paginated feed of approved confessions, the
+            # date filters and the queue of pending ones.
+            models.Index(fields=['status', '-created_at', '-id'], name='confession_feed_idx'),
+            # A user's confessions (dashboard, every status) and a community's, newest first.
+            models.Index(fields=['author', '-created_at', '-id'], name='confession_author_idx'),
+            models.Index(fields=['community', 'status', '-created_at', '-id'], name='confession_community_idx'),
+        ]
 
     def __str__(self):
         return self.content[:50]
 
-class Comment(models.Model):
-    confession = models.ForeignKey(Confession, related_name='comments', on_delete=models.CASCADE)
+class Comment(Moderated):
+    confession = models.ForeignKey(Confession, related_name='comments', on_delete=models.CASCADE, db_index=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # A confession's thread, newest first; also serves lookups by confession.
+            models.Index(fields=['confession', 'status', '-created_at', '-id'], name='comment_thread_idx'),
+            # The review queue: small, since it only holds pending comments not yet reviewed.
+            models.Index(
+                fields=['id'], condition=Q(status='pending', reviewed_at__isnull=True), name='comment_pending_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.content[:50]
+
+class Vote(models.Model):
+    """One upvote on a confession, cast by a user or by an anonymous session."""
+    confession = models.ForeignKey(Confession, related_name='votes', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    session_key = models.CharField(max_length=40, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['confession', 'user'], condition=Q(user__isnull=False), name='unique_user_vote',
+            ),
+            models.UniqueConstraint(
+                fields=['confession', 'session_key'], condition=Q(session_key__isnull=False), name='unique_session_vote',
+            ),
+            models.CheckConstraint(
+                condition=Q(user__isnull=False) | Q(session_key__isnull=False), name='vote_has_voter',
+            ),
+        ]
+
+    def __str__(self):
+        voter = self.user.username if self.user_id else 'anonymous'
+        return f'{voter} upvoted {self.confession_id}'
+
+
+class CommentSummary(models.Model):
+    """The latest AI summary of a confession's comments, keyed by a hash of the text it summarises."""
+    confession = models.OneToOneField(Confession, related_name='summary', on_delete=models.CASCADE)
+    content_hash = models.CharField(max_length=64)
+    summary = models.TextField()
+    # Comments added or deleted since the summary was generated; the
+    # summary is served as current only while this is zero.
+    stale_comments = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.summary[:50]
+
+
+class Job(models.Model):
+    """A unit of background work, claimed and run by ``manage.py run_workers``."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    # Identifies the work within its kind; at most one queued or running
+    # job exists per (kind, key), so repeat requests share it.
+    key = models.CharField(max_length=100, blank=True, default='')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Backs the worker's claim query.
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'key'], condition=Q(status__in=['queued', 'running']), name='unique_active_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.key} ({self.status})'
+
+
+class Ranking(models.Model):
+    """
+    A confession's precomputed score in one ranked feed (see rankings.py).
+    Rows exist for confessions inside the period's window; ``upvotes`` and
+    ``comment_count`` are the inputs the score was computed from.
+    """
+    HOT = 'hot'
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [
+        (HOT, 'Hot'),
+        (DAY, 'Top today'),
+        (WEEK, 'Top this week'),
+        (MONTH, 'Top this month'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    confession = models.ForeignKey(Confession, related_name='rankings', on_delete=models.CASCADE)
+    # Copied from the confession so ranked pages never join or sort on it.
+    community = models.ForeignKey(Community, null=True, blank=True, on_delete=models.CASCADE, db_index=False)
+    created_at = models.DateTimeField()
+    score = models.FloatField()
+    upvotes = models.IntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'confession'], name='unique_ranking'),
+        ]
+        indexes = [
+            models.Index(fields=['period', '-score', '-confession'], name='ranking_feed_idx'),
+            models.Index(fields=['period', 'community', '-score', '-confession'], name='ranking_community_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.period} {self.confession_id}: {self.score:.4f}'
+
+
+class LeaderboardSnapshot(models.Model):
+    """The leaderboard of one closed day or week, computed once by leaderboards.py."""
+    DAY = 'day'
+    WEEK = 'week'
+    KIND_CHOICES = [
+        (DAY, 'Confession of the day'),
+        (WEEK, 'Confession of the week'),
+    ]
+
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    start = models.DateField()
+    end = models.DateField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'start'], name='unique_leaderboard_window'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.start}'
+
+
+class LeaderboardEntry(models.Model):
+    snapshot = models.ForeignKey(LeaderboardSnapshot, related_name='entries', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    confession = models.ForeignKey(Confession, related_name='leaderboard_entries', on_delete=models.CASCADE)
+    score = models.FloatField()
+    upvotes = models.IntegerField()
+    comment_count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['snapshot', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'rank'], name='unique_leaderboard_rank'),
+        ]
+
+    def __str__(self):
+        return f'#{self.rank} in {self.snapshot}'
+
+
+class Streak(models.Model):
+    """A user's run of consecutive days with a confession, advanced once per closed day."""
+    user = models.OneToOneField(User, related_name='streak', on_delete=models.CASCADE)
+    current = models.PositiveIntegerField(default=0)
+    longest = models.PositiveIntegerField(default=0)
+    last_day = models.DateField(null=True, blank=True)
+    active_days = models.PositiveIntegerField(default=0)
+    # Times one of the user's confessions was confession of the day.
+    wins = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-current', '-longest'], name='streak_leaders_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} ({self.current} days)'
@@ -0,0 +1,128 @@
+"""Keyset (cursor) pagination helpers for the confession feeds.
+
+Instead of OFFSET pagination, each page remembers the sort key of its last
+row and the next page continues strictly after it. With a matching composite
+index this keeps every page load O(page size) no matter how deep the reader
+scrolls.
+
+``EstimatedCountPaginator`` is for the admin changelists, which need page
+numbers: it replaces their ``COUNT(*)`` with an estimate or a capped count.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded."""
+
+
+def get_page_size(request, setting='CONFESSIONS_PAGE_SIZE', default=20):
+    """Returns the requested page size, clamped to the configured maximum."""
+    page_size = getattr(settings, setting, default)
+    max_page_size = getattr(settings, 'CONFESSIONS_MAX_PAGE_SIZE', 100)
+    try:
+        page_size = int(request.GET.get('page_size', page_size))
+    except (TypeError, ValueError):
+        pass
+    return max(1, min(page_size, max_page_size))
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset on a fixed, unique ordering such as
+    ``('-created_at', '-id')``. The last field must be unique so that rows
+    sharing the same leading values are never skipped or repeated.
+    """
+
+    def __init__(self, queryset, ordering=('-created_at', '-id'), page_size=20):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.page_size = page_size
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.model_fields = [queryset.model._meta.get_field(name) for name in self.fields]
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.model_fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if len(values) != len(self.model_fields):
+                raise InvalidCursor('Cursor does not match the feed ordering.')
+            return [field.to_python(value) for field, value in zip(self.model_fields, values)]
+        except InvalidCursor:
+            raise
+        except Exception as e:
+            raise InvalidCursor(str(e)) from e
+
+    def _after(self, values):
+        """Builds the ``WHERE`` clause selecting rows after the given sort key."""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            clause = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for j in range(i):
+                clause &= Q(**{self.fields[j]: values[j]})
+            condition |= clause
+        return condition
+
+    def page(self, cursor=None):
+        """
+        Returns ``(items, next_cursor)`` for the page following ``cursor``.
+        ``next_cursor`` is None when there are no more rows.
+        """
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+        items = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            next_cursor = self.encode_cursor(items[-1])
+        return items, next_cursor
+
+
+def estimate_rows(model, using='default'):
+    """
+    A cheap estimate of the rows in ``model``'s table, or None if the
+    database offers none: PostgreSQL's planner statistics, or on SQLite the
+    largest id (exact until rows are deleted).
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table has been vacuumed or analyzed.
+        return row[0] if row and row[0] >= 0 else None
+    if connection.vendor == 'sqlite' and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        return model._default_manager.using(using).aggregate(last=Max('pk'))['last'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A ``Paginator`` that never counts a large table row by row. Unfiltered
+    querysets report ``estimate_rows`` once it is past
+    ``ADMIN_EXACT_COUNT_LIMIT``; filtered ones (and small tables) are
+    counted exactly, but only up to that limit, so a broad filter costs at
+    most that many index entries. Pages past the limit are not offered.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
@@ -0,0 +1,140 @@
+"""
+Precomputed "Hot" and "Top" feeds.
+
+Scores live in the ``Ranking`` table, one row per (period, confession), so
+a ranked page is a keyset read of ``ranking_feed_idx`` (or
+``ranking_community_idx``) on ``(score, confession)``: O(page size) however
+many confessions there are, with no per-request ORDER BY expression.
+
+``refresh`` brings the table up to date. It runs as a periodic job every
+``RANKING_REFRESH_INTERVAL`` seconds and is incremental: each row stores the
+upvote and comment counts its score was computed from and the community it
+was ranked in, and only rows whose inputs or community changed, new
+confessions and confessions that left a period's window are written.
+
+The hot score is ``log10(upvotes + RANKING_COMMENT_WEIGHT * comments)`` plus
+the creation time divided by ``RANKING_HOT_DECAY``: a confession needs ten
+times the engagement to outrank one posted ``RANKING_HOT_DECAY`` seconds
+later, so what ranks is engagement per unit of age. Because age enters
+through the (fixed) creation time, a score only changes when the
+confession's own counts do. Top scores are upvotes, with comments breaking
+ties.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, tasks
+from .models import Confession, Ranking
+from .pagination import KeysetPaginator
+
+# Feed ``sort`` values and the ranking period each reads.
+SORTS = {
+    'hot': Ranking.HOT,
+    'top_day': Ranking.DAY,
+    'top_week': Ranking.WEEK,
+    'top_month': Ranking.MONTH,
+}
+SORT_CHOICES = [('', 'New'), ('hot', 'Hot'), ('top_day', 'Top today'), ('top_week', 'Top week'), ('top_month', 'Top month')]
+
+
+def windows():
+    """Seconds of history each period ranks."""
+    return {
+        Ranking.HOT: getattr(settings, 'RANKING_HOT_WINDOW', 60 * 60 * 24 * 7),
+        Ranking.DAY: 60 * 60 * 24,
+        Ranking.WEEK: 60 * 60 * 24 * 7,
+        Ranking.MONTH: 60 * 60 * 24 * 30,
+    }
+
+
+def hot_score(upvotes, comment_count, created_at):
+    engagement = max(upvotes + getattr(settings, 'RANKING_COMMENT_WEIGHT', 2) * comment_count, 1)
+    return math.log10(engagement) + created_at.timestamp() / getattr(settings, 'RANKING_HOT_DECAY', 45000)
+
+
+def top_score(upvotes, comment_count):
+    # Comments only break ties between equal vote counts.
+    return upvotes + comment_count / (comment_count + 1)
+
+
+def score(period, upvotes, comment_count, created_at):
+    if period == Ranking.HOT:
+        return hot_score(upvotes, comment_count, created_at)
+    return top_score(upvotes, comment_count)
+
+
+@tasks.task('refresh_rankings')
+def refresh(batch_size=500):
+    """
+    Brings every period's rows in line with the confessions inside its
+    window. Returns the number of rows written and removed.
+    """
+    now = timezone.now()
+    cutoffs = {period: now - timedelta(seconds=seconds) for period, seconds in windows().items()}
+    candidates = Confession.objects.approved().filter(created_at__gte=min(cutoffs.values())).values_list(
+        'pk', 'community_id', 'created_at', 'upvotes', 'comment_count',
+    )
+    stored = {
+        (period, confession_id): (upvotes, comment_count, community_id)
+        for period, confession_id, upvotes, comment_count, community_id
+        in Ranking.objects.values_list('period', 'confession_id', 'upvotes', 'comment_count', 'community_id')
+    }
+
+    changed = []
+    for pk, community_id, created_at, upvotes, comment_count in candidates.iterator(chunk_size=2000):
+        for period, cutoff in cutoffs.items():
+            if created_at < cutoff:
+                continue
+            # A confession moved between communities must move feeds too.
+            if stored.pop((period, pk), None) != (upvotes, comment_count, community_id):
+                changed.append(Ranking(
+                    period=period, confession_id=pk, community_id=community_id, created_at=created_at,
+                    score=score(period, upvotes, comment_count, created_at),
+                    upvotes=upvotes, comment_count=comment_count,
+                ))
+    # Whatever was not matched above has aged out of its window.
+    expired = {}
+    for period, confession_id in stored:
+        expired.setdefault(period, []).append(confession_id)
+
+    with transaction.atomic():
+        for start in range(0, len(changed), batch_size):
+            Ranking.objects.bulk_create(
+                changed[start:start + batch_size],
+                update_conflicts=True,
+                unique_fields=['period', 'confession'],
+                update_fields=['community', 'score', 'upvotes', 'comment_count'],
+            )
+        removed = 0
+        for period, confession_ids in expired.items():
+            for start in range(0, len(confession_ids), batch_size):
+                removed += Ranking.objects.filter(
+                    period=period, confession_id__in=confession_ids[start:start + batch_size],
+                ).delete()[0]
+    if changed or removed:
+        caching.bump('rankings')
+    return {'updated': len(changed), 'removed': removed}
+
+
+tasks.periodic('refresh_rankings', 'RANKING_REFRESH_INTERVAL')
+
+
+def ranked_page(confessions, sort, cursor=None, page_size=20, community=None):
+    """
+    Returns ``(confessions, next_cursor)`` for one keyset page of a ranked
+    feed, best first, loading the page's rows from the ``confessions``
+    queryset. Raises ``InvalidCursor`` for a malformed cursor.
+    """
+    rankings = Ranking.objects.filter(period=SORTS[sort])
+    if community is not None:
+        rankings = rankings.filter(community=community)
+    paginator = KeysetPaginator(
+        rankings.only('confession', 'score'), ordering=('-score', '-confession_id'), page_size=page_size,
+    )
+    page, next_cursor = paginator.page(cursor)
+    loaded = confessions.in_bulk([ranking.confession_id for ranking in page])
+    return [loaded[ranking.confession_id] for ranking in page if ranking.confession_id in loaded], next_cursor
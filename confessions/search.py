@@ -0,0 +1,277 @@
+"""
+Full-text search for confessions.
+
+On SQLite, confessions and comments are mirrored into FTS5 virtual tables
+(``confessions_search`` and ``confessions_comment_search``) by triggers, so
+every write path - including ``bulk_create`` and cascading deletes - keeps
+the index in sync. The index covers every moderation status (the admin
+searches it too); ``search`` returns approved matches only. Other databases
+fall back to ``DatabaseSearchBackend``. A different backend can be plugged
+in with the ``CONFESSIONS_SEARCH_BACKEND`` setting (a dotted path to a backend class).
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .models import Comment, Confession
+
+# Private-use markers wrapped around matches by FTS5 snippet(); they are
+# swapped for <mark> tags only after the surrounding text has been escaped.
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# FTS5 tables and the triggers mirroring confession and comment text into
+# them. Everything is idempotent: SQLite drops triggers when Django remakes a
+# table during a schema migration, so they are re-installed after migrate.
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS confessions_search USING fts5(
+        content, tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS confessions_comment_search USING fts5(
+        content, confession_id UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_confession_insert
+    AFTER INSERT ON confessions_confession BEGIN
+        INSERT INTO confessions_search(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_confession_update
+    AFTER UPDATE OF content ON confessions_confession BEGIN
+        UPDATE confessions_search SET content = new.content WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_confession_delete
+    AFTER DELETE ON confessions_confession BEGIN
+        DELETE FROM confessions_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_comment_insert
+    AFTER INSERT ON confessions_comment BEGIN
+        INSERT INTO confessions_comment_search(rowid, content, confession_id)
+        VALUES (new.id, new.content, new.confession_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_comment_update
+    AFTER UPDATE OF content, confession_id ON confessions_comment BEGIN
+        UPDATE confessions_comment_search SET content = new.content, confession_id = new.confession_id
+        WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS confessions_search_comment_delete
+    AFTER DELETE ON confessions_comment BEGIN
+        DELETE FROM confessions_comment_search WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS confessions_search_confession_insert',
+    'DROP TRIGGER IF EXISTS confessions_search_confession_update',
+    'DROP TRIGGER IF EXISTS confessions_search_confession_delete',
+    'DROP TRIGGER IF EXISTS confessions_search_comment_insert',
+    'DROP TRIGGER IF EXISTS confessions_search_comment_update',
+    'DROP TRIGGER IF EXISTS confessions_search_comment_delete',
+    'DROP TABLE IF EXISTS confessions_search',
+    'DROP TABLE IF EXISTS confessions_comment_search',
+]
+
+
+def install_sqlite_schema(using='default', **kwargs):
+    """Creates the FTS5 tables and sync triggers if they are missing. Usable as a post_migrate receiver."""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for statement in SQLITE_SCHEMA:
+            cursor.execute(statement)
+
+
+@dataclass
+class SearchResult:
+    confession_id: int
+    rank: float
+    snippet: str
+    matched: str  # 'confession' or 'comment'
+
+
+def _highlight(text):
+    """Escapes a snippet and turns the match markers into <mark> tags."""
+    return escape(text).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+
+class DatabaseSearchBackend:
+    """Portable fallback using ``icontains``. Works everywhere, scales poorly."""
+
+    def filter(self, queryset, query):
+        return queryset.filter(content__icontains=query)
+
+    def filter_comments(self, queryset, query):
+        return queryset.filter(content__icontains=query)
+
+    def search(self, query, limit=20):
+        query = query.strip()
+        if not query:
+            return []
+        results = []
+        seen = set()
+        confessions = (
+            Confession.objects.approved().filter(content__icontains=query).order_by('-created_at')[:limit]
+        )
+        for confession_id, content in confessions.values_list('id', 'content'):
+            seen.add(confession_id)
+            results.append(SearchResult(confession_id, 0.0, self._snippet(content, query), 'confession'))
+        if len(results) < limit:
+            comments = (
+                Comment.objects.filter(content__icontains=query, status=Comment.APPROVED)
+                .exclude(confession_id__in=seen)
+                .order_by('-created_at')
+                .values_list('confession_id', 'content')[:limit * 2]
+            )
+            for confession_id, content in comments:
+                if confession_id in seen or len(results) >= limit:
+                    continue
+                seen.add(confession_id)
+                results.append(SearchResult(confession_id, 1.0, self._snippet(content, query), 'comment'))
+        return results
+
+    def _snippet(self, text, query, context=60):
+        start = text.lower().find(query.lower())
+        if start < 0:
+            return escape(text[:context * 2])
+        begin = max(0, start - context)
+        end = start + len(query)
+        snippet = (
+            ('…' if begin else '') + text[begin:start]
+            + _MATCH_START + text[start:end] + _MATCH_END
+            + text[end:end + context] + ('…' if end + context < len(text) else '')
+        )
+        return _highlight(snippet)
+
+    def rebuild(self):
+        """Nothing to rebuild: this backend has no index of its own."""
+        return 0
+
+
+class SQLiteFTSSearchBackend:
+    """FTS5-backed search with BM25 ranking and highlighted snippets."""
+
+    confession_table = 'confessions_search'
+    comment_table = 'confessions_comment_search'
+    # Matches in a confession's own text outrank matches in its comments.
+    comment_weight = 0.5
+
+    def match_query(self, query):
+        """
+        Turns free text into a safe FTS5 query: every word is quoted (so
+        operators typed by users are not interpreted) and the last word is
+        prefix-matched to support search-as-you-type.
+        """
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        terms = ['"%s"' % token for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def filter(self, queryset, query):
+        match = self.match_query(query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {self.confession_table} WHERE {self.confession_table} MATCH %s',
+            (match,),
+        ))
+
+    def filter_comments(self, queryset, query):
+        match = self.match_query(query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {self.comment_table} WHERE {self.comment_table} MATCH %s',
+            (match,),
+        ))
+
+    def search(self, query, limit=20):
+        match = self.match_query(query)
+        if match is None:
+            return []
+        sql = f"""
+            SELECT rowid, bm25({self.confession_table}) AS rank,
+                   snippet({self.confession_table}, 0, %s, %s, '…', 16), 'confession'
+            FROM {self.confession_table} WHERE {self.confession_table} MATCH %s
+            AND EXISTS (SELECT 1 FROM confessions_confession WHERE id = rowid AND status = %s)
+            UNION ALL
+            SELECT confession_id, bm25({self.comment_table}) * %s AS rank,
+                   snippet({self.comment_table}, 0, %s, %s, '…', 16), 'comment'
+            FROM {self.comment_table} WHERE {self.comment_table} MATCH %s
+            AND EXISTS (SELECT 1 FROM confessions_comment WHERE id = rowid AND status = %s)
+            ORDER BY rank
+            LIMIT %s
+        """
+        params = (
+            _MATCH_START, _MATCH_END, match, Confession.APPROVED,
+            self.comment_weight, _MATCH_START, _MATCH_END, match, Comment.APPROVED,
+            limit * 3,
+        )
+        results = []
+        seen = set()
+        # Raw SQL bypasses the routers; ask them which alias serves reads.
+        with connections[router.db_for_read(Confession)].cursor() as cursor:
+            cursor.execute(sql, params)
+            for confession_id, rank, snippet, matched in cursor.fetchall():
+                # Keep only the best-ranked hit for each confession.
+                if confession_id in seen:
+                    continue
+                seen.add(confession_id)
+                results.append(SearchResult(confession_id, rank, _highlight(snippet), matched))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def rebuild(self):
+        """Repopulates both FTS tables from scratch and returns the number of rows indexed."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.confession_table}')
+            cursor.execute(
+                f'INSERT INTO {self.confession_table}(rowid, content) '
+                'SELECT id, content FROM confessions_confession'
+            )
+            indexed = cursor.rowcount
+            cursor.execute(f'DELETE FROM {self.comment_table}')
+            cursor.execute(
+                f'INSERT INTO {self.comment_table}(rowid, content, confession_id) '
+                'SELECT id, content, confession_id FROM confessions_comment'
+            )
+            indexed += cursor.rowcount
+            for table in (self.confession_table, self.comment_table):
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES('optimize')")
+        return indexed
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Returns the configured search backend, picking one by database vendor by default."""
+    backend_path = getattr(settings, 'CONFESSIONS_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSSearchBackend()
+    return DatabaseSearchBackend()
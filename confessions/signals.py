@@ -0,0 +1,117 @@
+"""Signal handlers keeping derived data in sync with confessions and comments."""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, moderation, summaries
+from .models import Comment, Community, Confession
+
+
+def _comment_scopes(comment):
+    if Comment.confession.is_cached(comment):
+        community_id = comment.confession.community_id
+    else:
+        community_id = (
+            Confession.objects.filter(pk=comment.confession_id).values_list('community_id', flat=True).first()
+        )
+    return caching.confession_scopes(comment.confession_id, community_id)
+
+
+# The field each model is counted under.
+_PARENTS = {Comment: 'confession', Confession: 'community'}
+
+
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=Confession)
+def remember_stored_state(sender, instance, update_fields=None, **kwargs):
+    """
+    Loads the stored status and parent (confession or community) of a row
+    being updated, so post_save can redo the bookkeeping when an edit (the
+    admin change form, say) approves, rejects or moves it.
+    """
+    parent = _PARENTS[sender]
+    instance._stored_state = None
+    if instance._state.adding or (update_fields is not None and not {'status', parent, f'{parent}_id'} & set(update_fields)):
+        return
+    instance._stored_state = (
+        sender._base_manager.filter(pk=instance.pk).values_list('status', f'{parent}_id').first()
+    )
+
+
+def _changed_parents(instance):
+    """
+    The parent ids whose counts an update changed: the old and new parents
+    of an approved row that moved, or the parent of one whose approval
+    changed. None if the update changed no counts.
+    """
+    stored = getattr(instance, '_stored_state', None)
+    if stored is None:
+        return None
+    status, parent_id = stored
+    current = (instance.status, getattr(instance, f'{_PARENTS[type(instance)]}_id'))
+    if stored == current or instance.APPROVED not in (status, instance.status):
+        return None
+    return {parent_id, current[1]} - {None}
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """
+    A new comment is counted and makes the stored summary of its confession
+    stale; one held by the screen is queued for review instead. An edited
+    status or confession is handled like ``moderation.set_comment_status``.
+    """
+    if created and instance.status == Comment.APPROVED:
+        counters.comment_added(instance)
+        summaries.comments_changed(instance.confession_id)
+    elif created and instance.status == Comment.PENDING:
+        transaction.on_commit(moderation.enqueue_review)
+    elif (confession_ids := _changed_parents(instance)) is not None:
+        counters.recount(confession_ids=confession_ids, community_ids=[])
+        for confession_id in confession_ids:
+            summaries.comments_changed(confession_id)
+        caching.confessions_changed(confession_ids)
+    caching.bump(*_comment_scopes(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.status == Comment.APPROVED:
+        counters.comment_deleted(instance)
+        summaries.comments_changed(instance.confession_id)
+    caching.bump(*_comment_scopes(instance))
+
+
+@receiver(post_save, sender=Confession)
+def confession_saved(sender, instance, created, **kwargs):
+    """
+    An edited status or community is handled like
+    ``moderation.set_confession_status``.
+    """
+    if created and instance.status == Confession.APPROVED:
+        counters.confession_added(instance)
+    elif created and instance.status == Confession.PENDING:
+        transaction.on_commit(moderation.enqueue_review)
+    elif (community_ids := _changed_parents(instance)) is not None:
+        if community_ids:
+            counters.recount(confession_ids=[], community_ids=community_ids)
+        caching.bump('cards', 'rankings', 'leaderboards', 'communities', *(
+            f'community:{community_id}' for community_id in community_ids
+        ))
+    caching.bump(*caching.confession_scopes(instance.pk, instance.community_id))
+
+
+@receiver(post_delete, sender=Confession)
+def confession_deleted(sender, instance, **kwargs):
+    if instance.status == Confession.APPROVED:
+        counters.confession_deleted(instance)
+    # A deleted confession may be on a cached leaderboard.
+    caching.bump('leaderboards', *caching.confession_scopes(instance.pk, instance.community_id))
+
+
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+def community_changed(sender, instance, **kwargs):
+    # Cards show the community name, so they are invalidated too.
+    caching.forget_community_slug(instance.slug)
+    caching.bump('communities', f'community:{instance.pk}', 'cards')
@@ -33,7 +33,6 @@ document.addEventListener('DOMContentLoaded', function() {
     document.querySelectorAll('.upvote-btn').forEach(btn => {
         btn.addEventListener('click', function(e) {
             e.preventDefault();
-            this.style.color = 'var(--upvote-color)';
             this.style.transform = 'scale(1.2)';
             setTimeout(() => {
                 this.style.transform = 'scale(1)';
@@ -0,0 +1,511 @@
+"""
+AI comment summaries with caching, background refreshes and bounded concurrency.
+
+The summariser reads a confession's comments straight from the database,
+streaming them in chunks that fit a token budget and map-reducing threads
+too large for a single prompt. Results are stored per confession in
+``CommentSummary`` together with a hash of the comments they summarise, and
+mirrored into the Django cache so repeat requests never reach the database
+or Gemini. Adding or deleting a comment drops the cache entry and marks the
+stored summary stale (see ``signals.py``); a refresh that finds the comments
+hash to the stored one reuses the summary instead of regenerating it.
+
+With ``SUMMARY_BACKGROUND`` the request path never calls Gemini: a missing
+or stale summary is queued as a ``summarize`` job (see ``tasks.py``) and
+the endpoint answers with the job id to poll, plus the stale summary if
+there is one. Summaries are refreshed without being asked once
+``SUMMARY_REFRESH_THRESHOLD`` comments changed, and the workers periodically
+precompute them for the ``SUMMARY_PRECOMPUTE_TOP`` most commented
+confessions.
+
+Otherwise summaries are generated on request. Upstream calls then run on a
+small dedicated thread pool rather than in the request worker, so a slow
+Gemini response never ties up the thread serving page views, and requests
+that arrive while a summary is being generated share a single upstream run.
+``asummarize`` awaits that work from async views with a per-request
+timeout, and new work is refused once ``SUMMARY_MAX_CONCURRENCY`` +
+``SUMMARY_MAX_QUEUED`` calls are outstanding.
+"""
+import asyncio
+import contextvars
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+import google.generativeai as genai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F
+from django.urls import reverse
+from django.utils import timezone
+
+from confizz import instrumentation
+
+from . import tasks
+from .models import Comment, CommentSummary, Confession, Job
+
+PROMPT = (
+    "Please provide a concise, one-paragraph summary of the following user comments "
+    "for a confession:\n\n---\n{text}\n---"
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive batches of user comments on one confession. "
+    "Combine them into a single concise, one-paragraph summary:\n\n---\n{text}\n---"
+)
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class SummaryError(Exception):
+    """Raised when a summary cannot be produced."""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key: the first caller starts the
+    function and everyone else asking for the same key gets the same future.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def submit(self, key, fn, start):
+        """
+        Returns the future for ``key``, calling ``start(run)`` to schedule
+        ``fn`` if no call is in flight. ``start`` may raise to refuse the work.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future
+            future = self._calls[key] = Future()
+
+        def run():
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+
+        try:
+            start(run)
+        except BaseException:
+            with self._lock:
+                del self._calls[key]
+            raise
+        return future
+
+    def do(self, key, fn):
+        """Runs ``fn`` in the calling thread unless an identical call is already in flight."""
+        return self.submit(key, fn, start=lambda run: run()).result()
+
+
+class UpstreamPool:
+    """A bounded thread pool that rejects work instead of queueing without limit."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._outstanding = 0
+
+    @property
+    def max_workers(self):
+        return getattr(settings, 'SUMMARY_MAX_CONCURRENCY', 4)
+
+    @property
+    def max_outstanding(self):
+        return self.max_workers + getattr(settings, 'SUMMARY_MAX_QUEUED', 16)
+
+    def start(self, run):
+        with self._lock:
+            if self._outstanding >= self.max_outstanding:
+                raise SummaryError('The summariser is busy. Please try again shortly.', status=503)
+            self._outstanding += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='gemini')
+            executor = self._executor
+
+        def task():
+            try:
+                run()
+            finally:
+                with self._lock:
+                    self._outstanding -= 1
+                # Pool threads are not request threads; don't leak connections.
+                close_old_connections()
+
+        # In the submitting request's context, so its instrumentation and
+        # query watch see the call.
+        executor.submit(contextvars.copy_context().run, task)
+
+    @property
+    def outstanding(self):
+        return self._outstanding
+
+
+_single_flight = SingleFlight()
+upstream_pool = UpstreamPool()
+
+
+@instrumentation.collector
+def _pool_metrics():
+    yield 'confizz_gemini_outstanding', 'gauge', 'Gemini calls running or queued.', {}, upstream_pool.outstanding
+
+
+def cache_key(confession_id):
+    return f'confessions:summary:{confession_id}'
+
+
+@lru_cache(maxsize=None)
+def _get_model(api_key, model_name):
+    """Configures the Gemini client once per process and reuses the model."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def get_model():
+    api_key = getattr(settings, 'GEMINI_API_KEY', None)
+    if not api_key:
+        raise SummaryError('Gemini API key not configured. Please set GEMINI_API_KEY in your environment.')
+    return _get_model(api_key, getattr(settings, 'GEMINI_MODEL', 'gemini-2.0-flash'))
+
+
+def generate(text, prompt=PROMPT):
+    """Calls Gemini with ``text`` substituted into ``prompt``."""
+    model = get_model()
+    with instrumentation.timed('gemini'):
+        response = model.generate_content(
+            prompt.format(text=text),
+            request_options={'timeout': getattr(settings, 'SUMMARY_TIMEOUT', 30)},
+        )
+    # The response might be blocked for safety reasons.
+    if not response.parts:
+        raise SummaryError(
+            'The response from the AI was empty. This might be due to safety settings or an issue with the prompt.'
+        )
+    return response.text
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def _token_budget():
+    return getattr(settings, 'SUMMARY_TOKEN_BUDGET', 6000)
+
+
+def _comments(confession_id):
+    return (
+        Comment.objects.filter(confession_id=confession_id, status=Comment.APPROVED)
+        .order_by('created_at', 'id')
+        .values_list('id', 'content')
+        .iterator(chunk_size=500)
+    )
+
+
+def _hash_comment(digest, comment_id, content):
+    digest.update(f'{comment_id}:{content}\n'.encode('utf-8'))
+
+
+def content_hash(confession_id):
+    """The digest of a confession's approved comments, as ``build_summary`` returns it."""
+    digest = hashlib.sha256()
+    for comment_id, content in _comments(confession_id):
+        _hash_comment(digest, comment_id, content)
+    return digest.hexdigest()
+
+
+def iter_comment_chunks(confession_id, digest=None):
+    """
+    Streams a confession's comments from the database, oldest first, and
+    yields them packed into chunks that fit the prompt token budget. Only
+    one chunk is held in memory at a time. If ``digest`` (a hashlib object)
+    is given it is updated with every comment as it streams past.
+    """
+    budget = _token_budget()
+    chunk, used = [], 0
+    for comment_id, content in _comments(confession_id):
+        if digest is not None:
+            _hash_comment(digest, comment_id, content)
+        line = content.strip()
+        if not line:
+            continue
+        tokens = estimate_tokens(line)
+        if tokens > budget:
+            line = line[:budget * 4]
+            tokens = budget
+        if chunk and used + tokens > budget:
+            yield '\n'.join(chunk)
+            chunk, used = [], 0
+        chunk.append(line)
+        used += tokens
+    if chunk:
+        yield '\n'.join(chunk)
+
+
+def _reduce(partials):
+    """Combines partial summaries, in as many rounds as the token budget requires."""
+    budget = _token_budget()
+    while len(partials) > 1:
+        merged, batch, used = [], [], 0
+        for partial in partials:
+            tokens = estimate_tokens(partial)
+            if batch and used + tokens > budget:
+                merged.append(generate('\n\n'.join(batch), prompt=REDUCE_PROMPT))
+                batch, used = [], 0
+            batch.append(partial)
+            used += tokens
+        merged.append(generate('\n\n'.join(batch), prompt=REDUCE_PROMPT) if len(batch) > 1 else batch[0])
+        if len(merged) == len(partials):
+            # The budget is too small to merge anything; stop rather than loop.
+            return generate('\n\n'.join(merged), prompt=REDUCE_PROMPT)
+        partials = merged
+    return partials[0]
+
+
+def build_summary(confession_id):
+    """
+    Summarises all comments of a confession. Threads that fit in one
+    prompt are summarised directly; larger ones are map-reduced: each chunk
+    is summarised on its own and the partial summaries are then combined.
+    Returns ``(content_hash, summary)``.
+    """
+    digest = hashlib.sha256()
+    chunks = iter_comment_chunks(confession_id, digest)
+    first = next(chunks, None)
+    if first is None:
+        raise SummaryError('No comments to summarise yet.', status=400)
+    second = next(chunks, None)
+    if second is None:
+        return digest.hexdigest(), generate(first)
+    partials = [generate(first), generate(second)]
+    partials.extend(generate(chunk) for chunk in chunks)
+    return digest.hexdigest(), _reduce(partials)
+
+
+def get_stored(confession_id):
+    """
+    Returns ``(summary, fresh)`` for the stored summary of a confession, or
+    ``(None, False)`` if there is none. Only fresh summaries are cached.
+    """
+    cached = cache.get(cache_key(confession_id))
+    instrumentation.cache_lookup('summary', hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        return cached['summary'], True
+    stored = (
+        CommentSummary.objects.filter(confession_id=confession_id)
+        .values('content_hash', 'summary', 'stale_comments')
+        .first()
+    )
+    if stored is None:
+        return None, False
+    if stored['stale_comments']:
+        return stored['summary'], False
+    cache.set(cache_key(confession_id), {'hash': stored['content_hash'], 'summary': stored['summary']}, CACHE_TIMEOUT)
+    return stored['summary'], True
+
+
+def get_cached(confession_id):
+    """Returns the current summary for a confession, or None if it must be (re)generated."""
+    summary, fresh = get_stored(confession_id)
+    return summary if fresh else None
+
+
+def store(confession_id, digest, summary, seen_changes=0):
+    """
+    Saves a new summary. ``seen_changes`` is the stale count read before
+    the comments were, so changes made while Gemini was working keep the
+    summary marked stale.
+    """
+    # Plain UPDATE/INSERT statements rather than update_or_create(), whose
+    # read-then-write transaction SQLite refuses while another write is pending.
+    fields = {'content_hash': digest, 'summary': summary, 'updated_at': timezone.now()}
+    if seen_changes:
+        fields['stale_comments'] = F('stale_comments') - seen_changes
+    summaries = CommentSummary.objects.filter(confession_id=confession_id)
+    if not summaries.update(**fields):
+        try:
+            with transaction.atomic():
+                CommentSummary.objects.create(confession_id=confession_id, content_hash=digest, summary=summary)
+        except IntegrityError:
+            summaries.update(**fields)
+    if not summaries.filter(stale_comments__gt=0).exists():
+        cache.set(cache_key(confession_id), {'hash': digest, 'summary': summary}, CACHE_TIMEOUT)
+
+
+def refresh(confession_id):
+    """
+    Generates and stores the summary of a confession, returning it. A
+    stored summary whose ``content_hash`` still matches the approved
+    comments (they were added and removed again, say) is kept as it is
+    and marked fresh, without asking Gemini.
+    """
+    stored = (
+        CommentSummary.objects.filter(confession_id=confession_id)
+        .values('content_hash', 'summary', 'stale_comments')
+        .first()
+    ) or {'content_hash': None, 'summary': None, 'stale_comments': 0}
+    seen_changes = stored['stale_comments']
+    digest = content_hash(confession_id)
+    if digest == stored['content_hash']:
+        summary = stored['summary']
+    else:
+        digest, summary = build_summary(confession_id)
+    store(confession_id, digest, summary, seen_changes)
+    return summary
+
+
+def _background():
+    return getattr(settings, 'SUMMARY_BACKGROUND', False)
+
+
+def enqueue_refresh(confession_id):
+    return tasks.enqueue('summarize', key=confession_id, payload={'confession_id': confession_id})
+
+
+def comments_changed(confession_id):
+    """
+    Marks the summary of a confession stale after a comment was added or
+    deleted, queueing a refresh once ``SUMMARY_REFRESH_THRESHOLD`` changes
+    have accumulated.
+    """
+    cache.delete(cache_key(confession_id))
+    summaries = CommentSummary.objects.filter(confession_id=confession_id)
+    if not summaries.update(stale_comments=F('stale_comments') + 1):
+        return
+    threshold = getattr(settings, 'SUMMARY_REFRESH_THRESHOLD', 5)
+    if _background() and threshold and summaries.filter(stale_comments__gte=threshold).exists():
+        transaction.on_commit(lambda: enqueue_refresh(confession_id))
+
+
+def request_summary(confession_id):
+    """
+    Serves a summary without calling Gemini. Returns a payload with
+    ``status`` ``ready`` and the summary, or ``pending`` with the id of the
+    job producing it and the stale summary (or None) to show meanwhile.
+    """
+    summary, fresh = get_stored(confession_id)
+    if fresh:
+        return {'status': 'ready', 'summary': summary, 'cached': True}
+    if not Confession.objects.approved().filter(pk=confession_id).exists():
+        raise SummaryError('Confession not found.', status=404)
+    if summary is None and not Comment.objects.filter(confession_id=confession_id, status=Comment.APPROVED).exists():
+        raise SummaryError('No comments to summarise yet.', status=400)
+    job = enqueue_refresh(confession_id)
+    return {
+        'status': 'pending',
+        'summary': summary,
+        'job_id': job.pk,
+        'poll_url': reverse('confessions:summary_job', kwargs={'job_id': job.pk}),
+    }
+
+
+def job_status(job_id):
+    """Returns the poll payload for a ``summarize`` job."""
+    job = Job.objects.filter(pk=job_id, kind='summarize').values('status', 'result', 'error').first()
+    if job is None:
+        raise SummaryError('Job not found.', status=404)
+    if job['status'] == Job.DONE:
+        return {'status': 'ready', 'summary': job['result']['summary']}
+    if job['status'] == Job.FAILED:
+        return {'status': 'failed', 'error': job['error']}
+    return {'status': 'pending'}
+
+
+@tasks.task('summarize')
+def run_summary_job(confession_id):
+    try:
+        return {'summary': refresh(confession_id)}
+    except SummaryError as e:
+        if e.status < 500:
+            raise tasks.JobFailed(str(e))
+        raise
+
+
+def hot_confessions(limit=None, window=None):
+    """Ids of the confessions with the most comments in the last ``window`` seconds."""
+    if limit is None:
+        limit = getattr(settings, 'SUMMARY_PRECOMPUTE_TOP', 20)
+    if window is None:
+        window = getattr(settings, 'SUMMARY_PRECOMPUTE_WINDOW', 60 * 60 * 24)
+    since = timezone.now() - timedelta(seconds=window)
+    return list(
+        Comment.objects.filter(created_at__gte=since, status=Comment.APPROVED)
+        .values('confession')
+        .annotate(activity=Count('id'))
+        .order_by('-activity', '-confession')
+        .values_list('confession', flat=True)[:limit]
+    )
+
+
+@tasks.task('precompute_summaries')
+def precompute(limit=None, window=None):
+    """Queues summaries for the hottest confessions that lack a current one."""
+    hot = hot_confessions(limit, window)
+    current = set(
+        CommentSummary.objects.filter(confession_id__in=hot, stale_comments=0).values_list('confession_id', flat=True)
+    )
+    queued = [enqueue_refresh(pk).pk for pk in hot if pk not in current]
+    return {'hot': len(hot), 'queued': len(queued)}
+
+
+tasks.periodic('precompute_summaries', 'SUMMARY_PRECOMPUTE_INTERVAL')
+
+
+def _summary_future(confession_id):
+    """
+    Returns ``(summary, None)`` on a cache hit, else ``(None, future)`` for
+    the (possibly shared) summarisation running on the pool. The future
+    resolves to the new summary once it is stored.
+    """
+    summary = get_cached(confession_id)
+    if summary is not None:
+        return summary, None
+    if not Confession.objects.approved().filter(pk=confession_id).exists():
+        raise SummaryError('Confession not found.', status=404)
+    return None, _single_flight.submit(confession_id, lambda: refresh(confession_id), upstream_pool.start)
+
+
+def _timeout_error():
+    return SummaryError('The summary took too long. Please try again.', status=504)
+
+
+def summarize(confession_id):
+    """
+    Returns ``(summary, cached)`` for the comments of a confession, serving
+    repeats from the cache and coalescing concurrent requests.
+    """
+    summary, future = _summary_future(confession_id)
+    if future is None:
+        return summary, True
+    try:
+        return future.result(timeout=getattr(settings, 'SUMMARY_TIMEOUT', 30)), False
+    except TimeoutError:
+        raise _timeout_error()
+
+
+async def asummarize(confession_id):
+    """Async variant of ``summarize`` that waits without blocking the event loop."""
+    summary, future = await sync_to_async(_summary_future)(confession_id)
+    if future is None:
+        return summary, True
+    try:
+        # shield() keeps a timeout here from cancelling the call shared with other waiters.
+        summary = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)),
+            timeout=getattr(settings, 'SUMMARY_TIMEOUT', 30),
+        )
+    except asyncio.TimeoutError:
+        raise _timeout_error()
+    return summary, False
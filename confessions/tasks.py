@@ -0,0 +1,230 @@
+"""
+A small database-backed job queue.
+
+Jobs are ``Job`` rows, so no broker is needed: ``enqueue`` inserts one,
+``manage.py run_workers`` starts processes that ``claim`` due jobs and run
+the handler registered for their kind. A partial unique constraint keeps at
+most one queued or running job per (kind, key), which deduplicates repeat
+requests for the same work. Failed jobs are retried with backoff up to
+``JOBS_MAX_ATTEMPTS``; jobs left running by a worker that died are put back
+in the queue after ``JOBS_STALE_AFTER`` seconds.
+
+Handlers are registered with ``@task('kind')`` and receive the payload as
+keyword arguments. Their return value is stored as the job's ``result``;
+raising ``JobFailed`` fails the job without further attempts.
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from confizz import instrumentation
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_periodic = []
+
+
+class JobFailed(Exception):
+    """Raised by a handler when retrying the job cannot help."""
+
+
+def task(kind):
+    """Registers the decorated function as the handler for jobs of ``kind``."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def periodic(kind, interval):
+    """
+    Marks a registered job kind to be enqueued by the workers every
+    ``interval`` seconds (a setting name or a number).
+    """
+    _periodic.append((kind, interval))
+
+
+def _interval(value):
+    return float(getattr(settings, value, 0) if isinstance(value, str) else value)
+
+
+def enqueue(kind, key='', payload=None, delay=0):
+    """
+    Queues a job unless an identical one (same kind and key) is already
+    queued or running, in which case that job is returned instead.
+    """
+    key = str(key)
+    active = Job.objects.filter(kind=kind, key=key, status__in=[Job.QUEUED, Job.RUNNING]).first()
+    if active is not None:
+        return active
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                kind=kind, key=key, payload=payload or {},
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        # Lost a race with another enqueue of the same work.
+        return Job.objects.get(kind=kind, key=key, status__in=[Job.QUEUED, Job.RUNNING])
+
+
+def claim(worker_id, limit=1):
+    """
+    Atomically marks up to ``limit`` due jobs as running for ``worker_id``
+    and returns them. Concurrent workers never claim the same job: the
+    UPDATE only matches rows still queued. Where the backend supports it
+    the candidates are locked with SKIP LOCKED so workers don't wait on each
+    other; elsewhere (SQLite) selection and update are a single statement,
+    taking the write lock up front instead of upgrading a read lock.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    claimed = dict(status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            if not ids:
+                return []
+            Job.objects.filter(id__in=ids, status=Job.QUEUED).update(**claimed)
+    elif not Job.objects.filter(id__in=candidates.values('id')[:limit], status=Job.QUEUED).update(**claimed):
+        return []
+    return list(
+        Job.objects.filter(status=Job.RUNNING, locked_by=worker_id, locked_at=now).order_by('run_after', 'id')
+    )
+
+
+def run_job(job):
+    """Runs a claimed job and records its outcome."""
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind {job.kind!r}.')
+        result = handler(**job.payload)
+    except Exception as e:
+        if not isinstance(e, JobFailed):
+            logger.exception('Job %s (%s) failed on attempt %d.', job.pk, job.kind, job.attempts)
+        job.error = str(e)
+        retryable = handler is not None and not isinstance(e, JobFailed)
+        if retryable and job.attempts < getattr(settings, 'JOBS_MAX_ATTEMPTS', 3):
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+            job.save(update_fields=['status', 'error', 'run_after'])
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+    job.status = Job.DONE
+    job.result = result
+    job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return job
+
+
+def requeue_stale():
+    """Puts back jobs left running for longer than ``JOBS_STALE_AFTER``, e.g. by a worker that died."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOBS_STALE_AFTER', 300))
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by='', locked_at=None,
+    )
+
+
+@instrumentation.collector
+def _queue_metrics():
+    jobs = Job.objects.order_by().values_list('kind', 'status').annotate(jobs=Count('pk'))
+    for kind, status, count in jobs:
+        yield 'confizz_jobs', 'gauge', 'Jobs in the queue table.', {'kind': kind, 'status': status}, count
+
+
+def purge(older_than=None):
+    """Deletes finished jobs older than ``older_than`` seconds (default ``JOBS_KEEP_FINISHED``)."""
+    if older_than is None:
+        older_than = getattr(settings, 'JOBS_KEEP_FINISHED', 60 * 60 * 24 * 7)
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending(worker_id='inline', limit=100):
+    """Runs due jobs in the calling thread until none are left (or ``limit`` ran)."""
+    done = 0
+    while done < limit:
+        jobs = claim(worker_id, limit=1)
+        if not jobs:
+            break
+        run_job(jobs[0])
+        done += 1
+    return done
+
+
+class Worker:
+    """Polls the queue and runs jobs until stopped."""
+
+    def __init__(self, worker_id=None, poll_interval=None, batch_size=1):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_interval = poll_interval if poll_interval is not None else getattr(settings, 'JOBS_POLL_INTERVAL', 1.0)
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+        self._next_periodic = {}
+        self._next_maintenance = 0.0
+
+    def stop(self, *args):
+        self._stopped.set()
+
+    def schedule_periodic(self):
+        now = time.monotonic()
+        for kind, interval in _periodic:
+            seconds = _interval(interval)
+            if seconds <= 0 or self._next_periodic.get(kind, 0) > now:
+                continue
+            self._next_periodic[kind] = now + seconds
+            # Every worker schedules; the newest job tells them one already did.
+            recent = timezone.now() - timedelta(seconds=seconds)
+            if not Job.objects.filter(kind=kind, key='periodic', created_at__gt=recent).exists():
+                enqueue(kind, key='periodic')
+
+    def maintenance(self):
+        now = time.monotonic()
+        if now < self._next_maintenance:
+            return
+        self._next_maintenance = now + 60
+        requeue_stale()
+        purge()
+
+    def run_once(self):
+        """Claims and runs one batch. Returns the number of jobs run."""
+        self.maintenance()
+        self.schedule_periodic()
+        jobs = claim(self.worker_id, limit=self.batch_size)
+        for job in jobs:
+            run_job(job)
+        return len(jobs)
+
+    def run(self, max_jobs=None):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+        ran = 0
+        while not self._stopped.is_set():
+            try:
+                count = self.run_once()
+            finally:
+                close_old_connections()
+            ran += count
+            if max_jobs is not None and ran >= max_jobs:
+                break
+            if not count:
+                self._stopped.wait(self.poll_interval)
+        return ran
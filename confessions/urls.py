@@ -6,8 +6,13 @@ app_name = "confessions"
 
 urlpatterns = [
     path("", views.confession_list, name="confession_list"),
+    path("feed/", views.confession_feed, name="confession_feed"),
+    path("search/", views.search_confessions, name="search_confessions"),
     path('confession/<int:pk>/summarize/', views.summarize_comments, name='summarize_comments'),
+    path('summaries/jobs/<int:job_id>/', views.summary_job, name='summary_job'),
+    path('confession/<int:pk>/comments/', views.confession_comments, name='confession_comments'),
     path('confession/<int:pk>/comment/', views.add_comment, name='add_comment'),
+    path('confession/<int:pk>/vote/', views.vote_confession, name='vote_confession'),
     path('add_anonymous_confession/', views.confession_list, name='add_anonymous_confession'),  # Reuse confession_list view
     path('dashboard/', views.user_dashboard, name='user_dashboard'),
     path('signup/', views.signup_view, name='signup'),
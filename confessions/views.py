@@ -1,143 +1,324 @@
 """Views for handling confessions, comments, and user authentication with AI summarization."""
-import json
+from datetime import datetime, time, timedelta
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.contrib.auth import login, authenticate, logout
-from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth import alogin, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-import os
-import google.generativeai as genai
 from django.conf import settings
+from django.db import transaction
+from confizz.ratelimit import ratelimit
+from confizz.routers import read_only
 from .models import Confession, Comment, Community
-from .forms import ConfessionForm, CommentForm, SignUpForm, CommunityForm
+from .forms import ConfessionForm, CommentForm, SignUpForm, CommunityForm, LoginForm
+from .pagination import InvalidCursor, KeysetPaginator, get_page_size
+from .search import get_search_backend
+from . import caching, leaderboards, moderation, rankings, summaries, votes
 
 @csrf_exempt
+@ratelimit('summary', as_json=True)
 @require_POST
-def summarize_comments(request, pk):
+async def summarize_comments(request, pk):
     """
     Summarizes comments for a given confession using the Gemini AI model.
-    Expects a POST request with a JSON body containing 'comments_text'.
+    The comments are read server-side, so the request needs no body.
+    With SUMMARY_BACKGROUND the summary is produced by a worker: the view
+    returns it if it is current, and otherwise answers 202 with a job to
+    poll (and the previous summary, if any, to show meanwhile). Without it
+    the view awaits the Gemini call running on a bounded thread pool, so it
+    never holds a worker thread while the API responds.
     """
-    # Ensure the API key is configured in settings
-    api_key = getattr(settings, 'GEMINI_API_KEY', None)
-    if not api_key:
-        return JsonResponse({'error': 'Gemini API key not configured. Please set GEMINI_API_KEY in your environment.'}, status=500)
-
     try:
-        # Configure the Gemini client
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        # Get comments from the request
-        data = json.loads(request.body)
-        comments_text = data.get('comments_text', '')
-
-        if not comments_text.strip():
-            return JsonResponse({'error': 'No comments provided.'}, status=400)
-
-        prompt = f"Please provide a concise, one-paragraph summary of the following user comments for a confession:\n\n---\n{comments_text}\n---"
-        response = model.generate_content(prompt)
-
-        # The response might be blocked for safety reasons. It's good practice to check.
-        if response.parts:
-            return JsonResponse({'summary': response.text})
-        else:
-            return JsonResponse({'error': 'The response from the AI was empty. This might be due to safety settings or an issue with the prompt.'}, status=500)
+        if settings.SUMMARY_BACKGROUND:
+            payload = await sync_to_async(summaries.request_summary)(pk)
+            return JsonResponse(payload, status=200 if payload['status'] == 'ready' else 202)
+        summary, cached = await summaries.asummarize(pk)
+        return JsonResponse({'status': 'ready', 'summary': summary, 'cached': cached})
+    except summaries.SummaryError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
     except Exception as e:
         # A generic error handler for API or other issues
         return JsonResponse({'error': str(e)}, status=500)
 
-def confession_list(request):
-    if request.method == 'POST':
-        content = request.POST.get('content')
-        if content:
-            Confession.objects.create(content=content)  # Anonymous, no author
-            messages.success(request, 'Your anonymous confession has been posted!')
-            return redirect('confessions:confession_list')
+def summary_job(request, job_id):
+    """Reports on a background summary job started by ``summarize_comments``."""
+    try:
+        return JsonResponse(summaries.job_status(job_id))
+    except summaries.SummaryError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
 
-    confessions = Confession.objects.all().order_by('-created_at')
-    
-    # Filter by search query
+def _filter_confessions(request, confessions):
+    """Applies the ``search`` and ``date_filter`` GET parameters to a confession queryset."""
     search_query = request.GET.get('search', '').strip()
     if search_query:
-        confessions = confessions.filter(content__icontains=search_query)
-    
-    # Filter by date
+        confessions = get_search_backend().filter(confessions, search_query)
+
     date_filter = request.GET.get('date_filter', '')
     if date_filter:
-        from django.utils import timezone
-        from datetime import timedelta
         now = timezone.now()
         if date_filter == 'today':
-            confessions = confessions.filter(created_at__date=now.date())
+            # A range on the raw column (rather than created_at__date) can use the feed index.
+            start = timezone.make_aware(datetime.combine(timezone.localdate(now), time.min))
+            confessions = confessions.filter(created_at__gte=start, created_at__lt=start + timedelta(days=1))
         elif date_filter == 'week':
             confessions = confessions.filter(created_at__gte=now - timedelta(days=7))
         elif date_filter == 'month':
             confessions = confessions.filter(created_at__gte=now - timedelta(days=30))
         elif date_filter == 'all':
             pass  # No additional filter
-    
+    return confessions, search_query, date_filter
+
+def _confession_page(request):
+    """
+    Returns one keyset page of the feed as ``(confessions, next_cursor,
+    search_query, date_filter, sort)``. Ranked sorts (``hot``, ``top_*``)
+    read the precomputed rankings and ignore the search and date filters.
+    """
+    sort = request.GET.get('sort', '')
+    try:
+        if sort in rankings.SORTS:
+            page, next_cursor = rankings.ranked_page(
+                Confession.objects.approved().for_feed(), sort, request.GET.get('cursor'), get_page_size(request),
+            )
+            search_query, date_filter = '', ''
+        else:
+            sort = ''
+            confessions, search_query, date_filter = _filter_confessions(
+                request, Confession.objects.approved().for_feed(),
+            )
+            paginator = KeysetPaginator(confessions, page_size=get_page_size(request))
+            page, next_cursor = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid cursor.')
+    votes.apply_pending(page)
+    return _mark_voted(request, page), next_cursor, search_query, date_filter, sort
+
+def _mark_voted(request, confessions):
+    """Sets ``user_voted`` on each confession for the current voter in a single query."""
+    voted = votes.voted_confession_ids(
+        [confession.pk for confession in confessions], request.user, request.session.session_key,
+    )
+    for confession in confessions:
+        confession.user_voted = confession.pk in voted
+    return confessions
+
+@ratelimit('confession', key='user')
+@read_only
+@caching.cache_anonymous_page(caching.feed_page_scopes)
+def confession_list(request):
+    if request.method == 'POST':
+        content = request.POST.get('content')
+        if content:
+            status = moderation.initial_status(content)
+            with transaction.atomic():
+                Confession.objects.create(content=content, status=status)  # Anonymous, no author
+            if status == Confession.APPROVED:
+                messages.success(request, 'Your anonymous confession has been posted!')
+            else:
+                messages.info(request, 'Your anonymous confession will appear once it has been reviewed.')
+            return redirect('confessions:confession_list')
+
+    confessions, next_cursor, search_query, date_filter, sort = _confession_page(request)
     comment_form = CommentForm()
     return render(request, 'confessions/confession_list.html', {
         'confessions': confessions,
+        'cards_html': mark_safe(caching.render_cards(request, confessions, comment_form)),
+        'next_cursor': next_cursor,
         'comment_form': comment_form,
         'search_query': search_query,
         'date_filter': date_filter,
+        'sort': sort,
+        'sorts': rankings.SORT_CHOICES,
+        'leaderboards': leaderboards.current(),
+    })
+
+@read_only
+@caching.cache_anonymous_page(caching.feed_scopes)
+def confession_feed(request):
+    """
+    Returns the next page of the confession feed for infinite scroll.
+    Responds with JSON containing the rendered cards and the cursor for the
+    following page, or with the bare HTML fragment when ``format=html``.
+    """
+    confessions, next_cursor, _, _, _ = _confession_page(request)
+    html = caching.render_cards(request, confessions, CommentForm())
+    if request.GET.get('format') == 'html':
+        response = HttpResponse(html)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+    return JsonResponse({
+        'html': html,
+        'next_cursor': next_cursor,
+        'count': len(confessions),
+    })
+
+@read_only
+@caching.cache_anonymous_page(caching.comments_scopes)
+def confession_comments(request, pk):
+    """
+    Returns one keyset page of a confession's comments, newest first, so
+    card threads load only when expanded. Responds with JSON containing the
+    rendered comments and the cursor for the following page, or with the
+    bare HTML fragment when ``format=html``.
+    """
+    get_object_or_404(Confession.objects.approved().only('pk'), pk=pk)
+    paginator = KeysetPaginator(
+        Comment.objects.filter(confession_id=pk, status=Comment.APPROVED).select_related('author'),
+        page_size=get_page_size(request, 'CONFESSIONS_COMMENTS_PAGE_SIZE'),
+    )
+    try:
+        comments, next_cursor = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid cursor.')
+    html = render_to_string('confessions/comment_items.html', {
+        'comments': comments,
+        'first_page': not request.GET.get('cursor'),
+    }, request=request)
+    if request.GET.get('format') == 'html':
+        response = HttpResponse(html)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+    return JsonResponse({
+        'html': html,
+        'next_cursor': next_cursor,
+        'count': len(comments),
+    })
+
+@require_POST
+def vote_confession(request, pk):
+    """
+    Casts or retracts the current voter's upvote on a confession.
+    Logged-in users vote as themselves; anonymous visitors vote through
+    their session. Expects ``action`` to be ``up`` (default) or ``clear``.
+    """
+    get_object_or_404(Confession.objects.approved().only('pk'), pk=pk)
+    if request.user.is_authenticated:
+        voter = {'user': request.user}
+    else:
+        if not request.session.get(caching.VOTED_SESSION_KEY):
+            request.session[caching.VOTED_SESSION_KEY] = True
+        if not request.session.session_key:
+            request.session.save()
+        voter = {'session_key': request.session.session_key}
+
+    action = request.POST.get('action', 'up')
+    if action == 'up':
+        votes.cast_vote(pk, **voter)
+        voted = True
+    elif action == 'clear':
+        votes.retract_vote(pk, **voter)
+        voted = False
+    else:
+        return JsonResponse({'error': 'Unknown vote action.'}, status=400)
+    return JsonResponse({'upvotes': votes.get_upvotes(pk), 'voted': voted})
+
+@read_only
+def search_confessions(request):
+    """
+    Ranked full-text search over confessions and their comments.
+    Returns JSON with the best matches first, each with a highlighted snippet.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'No search query provided.'}, status=400)
+    limit = get_page_size(request)
+    results = get_search_backend().search(query, limit=limit)
+    confessions = Confession.objects.approved().in_bulk([result.confession_id for result in results])
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'id': result.confession_id,
+                'rank': result.rank,
+                'matched': result.matched,
+                'snippet': result.snippet,
+                'created_at': confessions[result.confession_id].created_at.isoformat(),
+                'upvotes': confessions[result.confession_id].upvotes,
+            }
+            for result in results
+            if result.confession_id in confessions
+        ],
     })
 
 @login_required
+@ratelimit('confession', key='user')
+@read_only
 def user_dashboard(request):
     if request.method == 'POST':
         content = request.POST.get('content')
         if content:
-            Confession.objects.create(content=content, author=request.user)
-            messages.success(request, 'Your confession has been posted!')
+            status = moderation.initial_status(content)
+            with transaction.atomic():
+                Confession.objects.create(content=content, author=request.user, status=status)
+            if status == Confession.APPROVED:
+                messages.success(request, 'Your confession has been posted!')
+            else:
+                messages.info(request, 'Your confession will appear once it has been reviewed.')
             return redirect('confessions:user_dashboard')
     
-    user_confessions = Confession.objects.filter(author=request.user).order_by('-created_at')
+    user_confessions = list(
+        Confession.objects.for_feed().filter(author=request.user).order_by('-created_at', '-id')
+    )
+    votes.apply_pending(user_confessions)
+    streak, achievements = leaderboards.achievements_for(request.user)
     return render(request, 'confessions/user_dashboard.html', {
         'user_confessions': user_confessions,
+        'streak': streak,
+        'achievements': achievements,
+        'total_upvotes': sum(confession.upvotes for confession in user_confessions),
+        'total_comments': sum(confession.comment_count for confession in user_confessions),
     })
 
+@ratelimit('comment', key='user')
 def add_comment(request, pk):
-    confession = get_object_or_404(Confession, pk=pk)
+    confession = get_object_or_404(Confession.objects.approved(), pk=pk)
     if request.method == 'POST':
         form = CommentForm(request.POST)
         if form.is_valid():
             comment = form.save(commit=False)
             comment.confession = confession
+            comment.status = moderation.initial_status(comment.content)
             if request.user.is_authenticated:
                 comment.author = request.user
-            comment.save()
+            # The comment and the counters it bumps commit together.
+            with transaction.atomic():
+                comment.save()
             return redirect('confessions:confession_list')
     return redirect('confessions:confession_list')
 
-def signup_view(request):
+@ratelimit('signup')
+async def signup_view(request):
     if request.method == 'POST':
         form = SignUpForm(request.POST)
-        if form.is_valid():
-            user = form.save()
-            login(request, user)
+        # Validation queries the database; the password is hashed on the hashing pool.
+        if await sync_to_async(form.is_valid)():
+            user = await form.asave()
+            await alogin(request, user, backend='confizz.passwords.ModelBackend')
             messages.success(request, 'Account created successfully!')
             return redirect('confessions:confession_list')
     else:
         form = SignUpForm()
-    return render(request, 'confessions/signup.html', {'form': form})
+    return await sync_to_async(render)(request, 'confessions/signup.html', {'form': form})
 
-def login_view(request):
+@ratelimit('login')
+async def login_view(request):
     if request.method == 'POST':
-        form = AuthenticationForm(request, data=request.POST)
-        if form.is_valid():
-            user = form.get_user()
-            login(request, user)
+        form = LoginForm(request, data=request.POST)
+        if await form.ais_valid():
+            await alogin(request, form.get_user())
             messages.success(request, 'Logged in successfully!')
             return redirect('confessions:confession_list')
     else:
-        form = AuthenticationForm()
-    return render(request, 'confessions/login.html', {'form': form})
+        form = LoginForm()
+    return await sync_to_async(render)(request, 'confessions/login.html', {'form': form})
 
 def logout_view(request):
     logout(request)
@@ -152,9 +333,11 @@ def fizzzones(request):
 
 # Community Views
 
+@read_only
+@caching.cache_anonymous_page(caching.communities_scopes)
 def community_list(request):
     """Display all communities with an option to create a new one."""
-    communities = Community.objects.all().order_by('-created_at')
+    communities = Community.objects.select_related('created_by').order_by('-created_at')
     return render(request, 'confessions/community_list.html', {
         'communities': communities,
     })
@@ -169,21 +352,45 @@ def community_create(request):
             community.created_by = request.user
             community.save()
             messages.success(request, 'Community created successfully!')
-            return redirect('confessions:community_detail', slug=community.slug)
+            return redirect('community-detail', slug=community.slug)
     else:
         form = CommunityForm()
     return render(request, 'confessions/community_form.html', {'form': form})
 
+@read_only
+@caching.cache_anonymous_page(caching.community_scopes)
 def community_detail(request, slug):
     """Display community details and list confessions in that community."""
-    community = get_object_or_404(Community, slug=slug)
-    confessions = community.confessions.all().order_by('-created_at')
+    community = get_object_or_404(Community.objects.select_related('created_by'), slug=slug)
+    confessions = Confession.objects.approved().for_feed(recent_comments=3)
+    sort = request.GET.get('sort', '')
+    next_cursor = None
+    if sort in rankings.SORTS:
+        try:
+            confessions, next_cursor = rankings.ranked_page(
+                confessions, sort, request.GET.get('cursor'), get_page_size(request), community=community,
+            )
+        except InvalidCursor:
+            raise Http404('Invalid cursor.')
+    else:
+        sort = ''
+        paginator = KeysetPaginator(confessions.filter(community=community), page_size=get_page_size(request))
+        try:
+            confessions, next_cursor = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Invalid cursor.')
     comment_form = CommentForm()
-    return render(request, 'confessions/community_detail.html', {
+    response = render(request, 'confessions/community_detail.html', {
         'community': community,
-        'confessions': confessions,
+        'confessions': votes.apply_pending(confessions),
+        'next_cursor': next_cursor,
         'comment_form': comment_form,
+        'sort': sort,
+        'sorts': rankings.SORT_CHOICES,
     })
+    if next_cursor:
+        response['X-Next-Cursor'] = next_cursor
+    return response
 
 @login_required
 def community_delete(request, slug):
@@ -193,12 +400,14 @@ def community_delete(request, slug):
     # Check if the current user is the creator
     if community.created_by != request.user:
         messages.error(request, 'You do not have permission to delete this community.')
-        return redirect('confessions:community_detail', slug=slug)
+        return redirect('community-detail', slug=slug)
     
     if request.method == 'POST':
-        community.delete()
+        # Cascaded confessions and comments adjust their counters in the same transaction.
+        with transaction.atomic():
+            community.delete()
         messages.success(request, 'Community deleted successfully!')
-        return redirect('confessions:community_list')
+        return redirect('community-list')
     
     return render(request, 'confessions/community_confirm_delete.html', {
         'community': community,
@@ -0,0 +1,366 @@
+"""
+Upvote ledger and counter maintenance.
+
+Every vote is a ``Vote`` row, unique per (confession, user) or
+(confession, session), so the ledger is the source of truth and duplicate
+clicks are absorbed by the unique constraints. ``Confession.upvotes`` is a
+denormalized counter adjusted only when the ledger actually changed.
+
+With ``VOTE_BUFFER_ENABLED`` the counter is written behind: deltas collect
+in an in-process buffer and are flushed as one bulk ``UPDATE`` per interval
+or size threshold, so a viral confession does not queue a write per click
+behind SQLite's single writer. Readers merge pending deltas into the counts
+they serve, and cached pages showing a confession are invalidated once its
+count is written. If a process dies with deltas still buffered, the ledger is
+intact: the periodic ``reconcile_votes`` job finds counters that disagree
+with it and rewrites them once they have stayed put for
+``VOTE_RECONCILE_QUIET`` seconds.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from confizz import instrumentation
+
+from . import caching, tasks
+from .models import Confession, Vote
+
+logger = logging.getLogger(__name__)
+
+
+class VoteCounterBuffer:
+    """Thread-safe buffer of pending ``upvotes`` deltas keyed by confession id."""
+
+    # Rows per UPDATE statement, keeping the CASE expression well inside
+    # SQLite's bound-parameter limit.
+    chunk_size = 500
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._stopped = threading.Event()
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'VOTE_BUFFER_FLUSH_INTERVAL', 2.0)
+
+    @property
+    def max_pending(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return getattr(settings, 'VOTE_BUFFER_MAX_PENDING', 500)
+
+    def add(self, confession_id, delta):
+        """Buffers a delta, flushing inline once the size or age threshold is crossed."""
+        with self._lock:
+            self._pending[confession_id] = self._pending.get(confession_id, 0) + delta
+            due = (
+                len(self._pending) >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        self._ensure_flusher()
+        if due:
+            # Never queue a request behind a flush that is already running.
+            self.flush(blocking=False)
+
+    def pending(self, confession_id):
+        """Returns the not-yet-persisted delta for one confession."""
+        with self._lock:
+            return self._pending.get(confession_id, 0) + self._inflight.get(confession_id, 0)
+
+    def apply_pending(self, confessions):
+        """Adds pending deltas to ``upvotes`` on already-loaded confessions."""
+        with self._lock:
+            if not self._pending and not self._inflight:
+                return confessions
+            for confession in confessions:
+                confession.upvotes += (
+                    self._pending.get(confession.pk, 0) + self._inflight.get(confession.pk, 0)
+                )
+        return confessions
+
+    def flush(self, blocking=True):
+        """
+        Persists all pending deltas. Deltas stay visible to readers (as
+        in-flight) until the UPDATE commits, and are merged back into the
+        buffer if it fails so a later flush can retry them.
+        Returns the number of confessions updated.
+        """
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                deltas = {pk: delta for pk, delta in self._pending.items() if delta}
+                self._pending = {}
+                self._inflight = deltas
+            if not deltas:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    items = list(deltas.items())
+                    for i in range(0, len(items), self.chunk_size):
+                        chunk = items[i:i + self.chunk_size]
+                        Confession.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                            upvotes=F('upvotes') + Case(
+                                *[When(pk=pk, then=Value(delta)) for pk, delta in chunk],
+                                default=Value(0),
+                                output_field=IntegerField(),
+                            )
+                        )
+            except Exception:
+                with self._lock:
+                    for pk, delta in deltas.items():
+                        self._pending[pk] = self._pending.get(pk, 0) + delta
+                    self._inflight = {}
+                self.failed_flushes += 1
+                logger.exception('Vote counter flush failed; %d deltas re-queued.', len(deltas))
+                return 0
+
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._inflight = {}
+            caching.confessions_changed(list(deltas))
+            self.flushes += 1
+            self.flushed_rows += len(deltas)
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            return len(deltas)
+        finally:
+            self._flush_lock.release()
+
+    def metrics(self):
+        with self._lock:
+            depth = len(self._pending)
+            pending_votes = sum(abs(delta) for delta in self._pending.values())
+            inflight = len(self._inflight)
+        return {
+            'depth': depth,
+            'pending_votes': pending_votes,
+            'inflight': inflight,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'flushed_rows': self.flushed_rows,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+        }
+
+    def _ensure_flusher(self):
+        """Starts the background flusher so idle periods still get flushed."""
+        if self._flusher is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='vote-counter-flusher', daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """Stops the background flusher after a final flush."""
+        self._stopped.set()
+        self.flush()
+
+
+counter_buffer = VoteCounterBuffer()
+
+
+@instrumentation.collector
+def _buffer_metrics():
+    stats = counter_buffer.metrics()
+    yield 'confizz_vote_buffer_depth', 'gauge', 'Confessions with unflushed vote deltas.', {}, stats['depth']
+    yield 'confizz_vote_buffer_inflight', 'gauge', 'Confessions in the flush being written.', {}, stats['inflight']
+    yield 'confizz_vote_buffer_flushes_total', 'counter', 'Vote buffer flushes.', {}, stats['flushes']
+    yield 'confizz_vote_buffer_failed_flushes_total', 'counter', 'Failed vote buffer flushes.', {}, stats['failed_flushes']
+    yield 'confizz_vote_buffer_flushed_rows_total', 'counter', 'Counter rows written by flushes.', {}, stats['flushed_rows']
+    yield (
+        'confizz_vote_buffer_last_flush_seconds', 'gauge', 'Duration of the last flush.', {},
+        stats['last_flush_seconds'],
+    )
+
+
+def _buffer_enabled():
+    return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+
+def _voter_filter(user=None, session_key=None):
+    if user is not None and user.is_authenticated:
+        return {'user': user}
+    if session_key:
+        return {'session_key': session_key}
+    raise ValueError('A vote needs an authenticated user or a session key.')
+
+
+def _apply_delta(confession_id, delta):
+    if _buffer_enabled():
+        # Only buffer deltas whose ledger change actually commits.
+        transaction.on_commit(lambda: counter_buffer.add(confession_id, delta))
+    else:
+        Confession.objects.filter(pk=confession_id).update(upvotes=F('upvotes') + delta)
+        caching.confessions_changed([confession_id])
+
+
+def cast_vote(confession_id, user=None, session_key=None):
+    """Records an upvote. Returns True if it was new, False if the voter had already voted."""
+    voter = _voter_filter(user, session_key)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Vote.objects.create(confession_id=confession_id, **voter)
+        except IntegrityError:
+            return False
+        _apply_delta(confession_id, 1)
+    return True
+
+
+def retract_vote(confession_id, user=None, session_key=None):
+    """Removes the voter's upvote. Returns True if there was one to remove."""
+    voter = _voter_filter(user, session_key)
+    with transaction.atomic():
+        deleted, _ = Vote.objects.filter(confession_id=confession_id, **voter).delete()
+        if not deleted:
+            return False
+        _apply_delta(confession_id, -deleted)
+    return True
+
+
+def get_upvotes(confession_id):
+    """Returns the current count, including any buffered votes."""
+    upvotes = Confession.objects.filter(pk=confession_id).values_list('upvotes', flat=True).first()
+    if upvotes is None:
+        return None
+    return upvotes + counter_buffer.pending(confession_id)
+
+
+def apply_pending(confessions):
+    """Merges buffered votes into the ``upvotes`` of loaded confessions."""
+    return counter_buffer.apply_pending(confessions)
+
+
+def _ledger_count():
+    return Coalesce(Subquery(
+        Vote.objects.filter(confession=OuterRef('pk'))
+        .order_by()
+        .values('confession')
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def reconcile(confession_ids=None):
+    """
+    Recomputes ``upvotes`` from the vote ledger. Returns the number of rows
+    updated.
+
+    Only this process's buffer is flushed first: deltas still buffered in
+    running web processes are added again when they flush, so run it only
+    while no web process holds buffered votes (e.g. with them stopped).
+    The ``reconcile_votes`` job repairs lost deltas safely while they run.
+    """
+    counter_buffer.flush()
+    confessions = Confession.objects.all()
+    if confession_ids is not None:
+        confessions = confessions.filter(pk__in=confession_ids)
+    return confessions.update(upvotes=_ledger_count())
+
+
+def drifted(confession_ids=None, limit=None):
+    """
+    Returns ``[(id, upvotes, ledger count)]`` of confessions whose counter
+    disagrees with the ledger and that no vote was cast on in the last
+    ``VOTE_RECONCILE_QUIET`` seconds.
+    """
+    quiet = getattr(settings, 'VOTE_RECONCILE_QUIET', 60)
+    recent = Vote.objects.filter(confession=OuterRef('pk'), created_at__gt=timezone.now() - timedelta(seconds=quiet))
+    confessions = Confession.objects.all()
+    if confession_ids is not None:
+        confessions = confessions.filter(pk__in=confession_ids)
+    confessions = (
+        confessions.annotate(ledger=_ledger_count())
+        .exclude(upvotes=F('ledger'))
+        .exclude(Exists(recent))
+        .order_by('pk')
+        .values_list('pk', 'upvotes', 'ledger')
+    )
+    return [tuple(row) for row in confessions[:limit]]
+
+
+@tasks.task('reconcile_votes')
+def reconcile_drifted(candidates=None, batch_size=1000):
+    """
+    Repairs counters that lost the deltas buffered by a process that died,
+    while web processes keep running. A first pass records up to
+    ``batch_size`` drifted confessions and checks them again
+    ``VOTE_RECONCILE_QUIET`` seconds later. A delta still buffered in a live
+    process is flushed within ``VOTE_BUFFER_FLUSH_INTERVAL`` and moves the
+    counter, so only counters that stayed put are rewritten, each only if
+    it still holds the value that was checked.
+    """
+    if candidates is None:
+        found = drifted(limit=batch_size)
+        if found:
+            tasks.enqueue(
+                'reconcile_votes', key='confirm', payload={'candidates': found},
+                delay=getattr(settings, 'VOTE_RECONCILE_QUIET', 60),
+            )
+        return {'drifted': len(found)}
+
+    candidates = {tuple(candidate) for candidate in candidates}
+    repaired = []
+    with transaction.atomic():
+        for pk, upvotes, ledger in candidates.intersection(drifted([pk for pk, _, _ in candidates])):
+            if Confession.objects.filter(pk=pk, upvotes=upvotes).update(upvotes=ledger):
+                repaired.append(pk)
+    if repaired:
+        logger.warning('Reconciled upvotes on %d confessions with the vote ledger.', len(repaired))
+        caching.confessions_changed(repaired)
+    return {'repaired': len(repaired)}
+
+
+tasks.periodic('reconcile_votes', 'VOTE_RECONCILE_INTERVAL')
+
+
+def voted_confession_ids(confession_ids, user=None, session_key=None):
+    """
+    Returns the subset of ``confession_ids`` the voter has upvoted: the
+    authenticated user, or else the anonymous session.
+    """
+    if not confession_ids:
+        return set()
+    try:
+        voter = _voter_filter(user, session_key)
+    except ValueError:
+        return set()
+    return set(
+        Vote.objects.filter(confession_id__in=confession_ids, **voter).values_list('confession_id', flat=True)
+    )
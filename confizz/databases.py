@@ -0,0 +1,70 @@
+"""
+Builds DATABASES entries from environment variables.
+
+``DATABASE_URL`` and ``DATABASE_REPLICAS`` take ``postgres://`` URLs or
+plain SQLite file paths, so the read/write split can be tried locally
+against two SQLite files or two Postgres instances.
+"""
+import sqlite3
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+POSTGRES_SCHEMES = ('postgres', 'postgresql', 'pgsql')
+
+
+def database_from_url(spec, **extra):
+    """Returns a DATABASES entry for a ``postgres://`` URL or a SQLite path."""
+    url = urlsplit(spec)
+    if url.scheme not in POSTGRES_SCHEMES:
+        return {'ENGINE': 'django.db.backends.sqlite3', 'NAME': spec, **extra}
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': unquote(url.path.lstrip('/')),
+        'USER': unquote(url.username or ''),
+        'PASSWORD': unquote(url.password or ''),
+        'HOST': url.hostname or '',
+        'PORT': url.port or '',
+        'OPTIONS': dict(parse_qsl(url.query)),
+        **extra,
+    }
+
+
+def replica_database(spec, sqlite_pragmas=(), timeout=5.0, **extra):
+    """
+    Returns a read-only DATABASES entry for a replica. SQLite replicas are
+    opened with ``mode=ro``; Postgres sessions start read-only. Tests read
+    replicas through the test default database.
+    """
+    database = database_from_url(spec, TEST={'MIRROR': 'default'}, **extra)
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        database['NAME'] = f'file:{spec}?mode=ro'
+        database['OPTIONS'] = {
+            'init_command': '; '.join([*sqlite_pragmas, 'PRAGMA query_only=ON']),
+            'timeout': timeout,
+        }
+    else:
+        database['OPTIONS'].setdefault('options', '-c default_transaction_read_only=on')
+    return database
+
+
+def sqlite_path(database):
+    """The file behind a SQLite DATABASES entry, with any ``file:`` URI stripped."""
+    name = str(database['NAME'])
+    if name.startswith('file:'):
+        name = unquote(urlsplit(name).path)
+    return name
+
+
+def sync_sqlite(source, target, pages=1024):
+    """
+    Copies the SQLite database at ``source`` over ``target`` with the
+    online backup API. The target is switched to WAL first, so readers of
+    the replica keep their snapshot while the copy is written.
+    """
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        dst.execute('PRAGMA journal_mode=WAL')
+        src.backup(dst, pages=pages)
+    finally:
+        dst.close()
+        src.close()
@@ -0,0 +1,367 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` samples ``METRICS_SAMPLE_RATE`` of requests and
+records for each one the wall time, database queries and their time,
+template rendering time, cache hits and misses and time spent waiting on
+Gemini. The breakdown is reported three ways:
+
+* a ``Server-Timing`` header (shown by browser dev tools), when
+  ``SERVER_TIMING`` is on;
+* one JSON line per request on the ``confizz.performance`` logger, at INFO,
+  or WARNING for requests slower than ``SLOW_REQUEST_THRESHOLD`` seconds;
+* histograms and counters in the Prometheus text format at ``/metrics``,
+  served to scrapers presenting ``METRICS_TOKEN`` as a bearer token or
+  connecting from ``METRICS_ALLOWED_IPS``, and a 404 to everyone else.
+  Collectors registered with ``@collector`` add gauges read at scrape time.
+
+The hooks (the database execute wrapper, the template backend,
+``cache_lookup`` and ``timed``) look up the current request's record in a
+context variable and do nothing else when there is none, so an unsampled
+request costs one ``random()`` call. Metrics live in the process: each
+worker serves its own.
+"""
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger('confizz.performance')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_timings = ContextVar('request_timings', default=None)
+_collectors = []
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [count per bucket (the last is +Inf), sum]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels([*key, ("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(key)} {_number(total)}'
+            yield f'{self.name}_count{_labels(key)} {cumulative}'
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_labels(key)} {_number(value)}'
+
+
+REQUEST_SECONDS = Histogram('confizz_request_duration_seconds', 'Wall time of sampled requests.')
+DB_SECONDS = Histogram('confizz_db_duration_seconds', 'Database time per sampled request.')
+DB_QUERIES = Histogram('confizz_db_queries', 'Database queries per sampled request.', QUERY_BUCKETS)
+TEMPLATE_SECONDS = Histogram('confizz_template_render_seconds', 'Template rendering time per sampled request.')
+CACHE_LOOKUPS = Counter('confizz_cache_lookups_total', 'Cache lookups made by sampled requests.')
+UPSTREAM_SECONDS = Histogram('confizz_upstream_duration_seconds', 'Latency of outbound calls (Gemini).')
+METRICS = [REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, TEMPLATE_SECONDS, CACHE_LOOKUPS, UPSTREAM_SECONDS]
+
+
+class RequestTimings:
+    """What one sampled request spent its time on."""
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.template_seconds = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.upstream_seconds = 0.0
+        self.upstream_calls = 0
+
+
+def current():
+    """The record of the sampled request being handled, or None."""
+    return _timings.get()
+
+
+def cache_lookup(cache, hits=0, misses=0):
+    """Counts cache hits and misses of the named cache against the current request."""
+    timings = _timings.get()
+    if timings is None:
+        return
+    timings.cache_hits += hits
+    timings.cache_misses += misses
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
+
+
+@contextmanager
+def timed(upstream):
+    """
+    Times an outbound call. Upstream calls are rare and slow, so they are
+    recorded whether or not the request is sampled (or there is one: the
+    call may run on a worker).
+    """
+    outcome = 'error'
+    started = time.perf_counter()
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(elapsed, upstream=upstream, outcome=outcome)
+        timings = _timings.get()
+        if timings is not None:
+            timings.upstream_seconds += elapsed
+            timings.upstream_calls += 1
+
+
+def collector(fn):
+    """
+    Registers ``fn`` to be called on every scrape. It yields
+    ``(name, type, help, labels, value)`` tuples, ``labels`` being a dict.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def _execute(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_seconds += time.perf_counter() - started
+        timings.db_queries += 1
+
+
+def _install(connection):
+    # Outermost, and at the front so connection.execute_wrapper() blocks
+    # opened around it still pop their own wrapper.
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+def _install_on_new_connection(sender, connection, **kwargs):
+    _install(connection)
+
+
+connection_created.connect(_install_on_new_connection)
+
+
+class TimedTemplate:
+    """Wraps a backend template to time its top-level renders."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = _timings.get()
+        # Nested render_to_string calls are already inside the outer timing.
+        if timings is None or timings.rendering:
+            return self.template.render(context, request)
+        timings.rendering = True
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings.rendering = False
+            timings.template_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, with rendering time recorded per request."""
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+
+def _sampled():
+    rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class PerformanceMiddleware:
+    """Records where sampled requests spend their time; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _sampled():
+            return self.get_response(request)
+        timings = self.start()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not _sampled():
+            return await self.get_response(request)
+        timings = self.start()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    def start(self):
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        return RequestTimings()
+
+    def finish(self, request, response, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method)
+        DB_SECONDS.observe(timings.db_seconds, view=view)
+        DB_QUERIES.observe(timings.db_queries, view=view)
+        TEMPLATE_SECONDS.observe(timings.template_seconds, view=view)
+
+        if getattr(settings, 'SERVER_TIMING', True):
+            entries = [
+                f'app;dur={elapsed * 1000:.1f}',
+                f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries"',
+                f'tpl;dur={timings.template_seconds * 1000:.1f}',
+                f'cache;desc="{timings.cache_hits} hits/{timings.cache_misses} misses"',
+            ]
+            if timings.upstream_calls:
+                entries.append(f'gemini;dur={timings.upstream_seconds * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+
+        slow = elapsed >= getattr(settings, 'SLOW_REQUEST_THRESHOLD', 1.0)
+        level = logging.WARNING if slow else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'db_queries': timings.db_queries,
+                'db_ms': round(timings.db_seconds * 1000, 2),
+                'template_ms': round(timings.template_seconds * 1000, 2),
+                'cache_hits': timings.cache_hits,
+                'cache_misses': timings.cache_misses,
+                'gemini_ms': round(timings.upstream_seconds * 1000, 2),
+                'gemini_calls': timings.upstream_calls,
+            }))
+        return response
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    described = set()
+    for fn in _collectors:
+        for name, kind, documentation, labels, value in fn():
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _may_scrape(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and constant_time_compare(credentials.strip(), token):
+            return True
+    # Behind a reverse proxy REMOTE_ADDR is the proxy's address for every
+    # request, which is why no address is allowed unless configured.
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, for METRICS_TOKEN or METRICS_ALLOWED_IPS only."""
+    if not _may_scrape(request):
+        raise Http404
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,131 @@
+"""
+Password hashing profiles and authentication that keeps hashing off the event loop.
+
+``settings.PASSWORD_HASHING`` picks the hasher for new passwords: ``'scrypt'``
+(the default; in the standard library), ``'argon2'`` (needs argon2-cffi) or
+``'pbkdf2'`` (Django's default). Their costs come from settings rather than
+Django's class attributes, and Django's ``check_password`` rehashes a
+password on a successful login whenever it was stored with another hasher
+or other parameters, so changing the profile upgrades users as they log in.
+
+Hashing is deliberately slow, tens to hundreds of milliseconds of CPU.
+Django's async authentication runs it on the event loop, and a sync login
+view under ASGI runs on the single thread shared by every sync view, so a
+burst of logins stalls everything else. ``ModelBackend.aauthenticate`` does
+the database work as usual but hashes on a pool of
+``PASSWORD_HASHING_WORKERS`` threads (hashlib and argon2 release the GIL
+while hashing), and ``LoginForm`` (in confessions/forms.py) uses it.
+``manage.py bench_logins`` compares the profiles.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import backends, get_user_model, hashers, password_validation
+from django.core.exceptions import PermissionDenied
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    # A ceiling, not an allocation: scrypt needs 128 * N * r bytes, and
+    # without it OpenSSL refuses anything over 32 MiB (N above 2 ** 14).
+    maxmem = 512 * 1024 * 1024
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', 5)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', 2)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', 19 * 1024)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', 1)
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1
+            _executor = ThreadPoolExecutor(workers, thread_name_prefix='password')
+        return _executor
+
+
+async def run(func, *args, **kwargs):
+    """Runs the CPU-bound ``func`` on the hashing pool. It must not touch the database."""
+    return await asyncio.get_running_loop().run_in_executor(_pool(), partial(func, *args, **kwargs))
+
+
+async def amake_password(password):
+    return await run(hashers.make_password, password)
+
+
+class ModelBackend(backends.ModelBackend):
+    """
+    Django's ModelBackend, with ``aauthenticate`` hashing on the pool. A
+    username and password it rejects raise ``PermissionDenied``, which ends
+    authentication there: Django's ModelBackend, listed after it for older
+    sessions, would check the same password again, on the event loop.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            raise PermissionDenied
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway, so a missing user takes as long as a wrong password (#20760).
+            await amake_password(password)
+            raise PermissionDenied
+        is_correct, must_update = await run(hashers.verify_password, password, user.password)
+        if not is_correct:
+            raise PermissionDenied
+        if must_update:
+            # An upgrade to the current profile; not a password change.
+            user.password = await amake_password(password)
+            await user.asave(update_fields=['password'])
+        if not self.user_can_authenticate(user):
+            raise PermissionDenied
+        return user
+
+
+def warm_up():
+    """
+    Loads the hashers and the password validators, with the common
+    password list, so the first signup or login doesn't pay for it.
+    """
+    hashers.get_hashers()
+    password_validation.get_default_password_validators()
@@ -0,0 +1,211 @@
+"""
+Slow-query and N+1 detection for debug and test runs.
+
+Within ``watch()``, an execute wrapper on every database connection
+records each query's SQL shape (the statement with literals and IN lists
+collapsed), its duration and where it came from: the template line being
+rendered, or else the innermost frame of project code, usually the view.
+The same shape run ``QUERY_REPEAT_THRESHOLD`` times from one place is an
+N+1 (a template looping over ``confession.comments.all``, say). The active
+watchers live in a context variable, so queries that ``sync_to_async`` (or
+the summary pool) runs on another thread for an async view still count
+against the request.
+
+``QueryWatchMiddleware`` watches every request, sync or async, while
+``QUERY_WATCH`` is on, logs queries slower than
+``SLOW_QUERY_THRESHOLD`` seconds and logs, or with ``QUERY_WATCH_ACTION =
+'raise'`` raises, ``RepeatedQueries`` for N+1s. ``QueryBudgetMixin`` gives
+test cases ``assertQueryBudget`` to fail on the same problems or on more
+queries than a view is allowed.
+
+Walking the stack for every query is slow; none of this is meant for
+production traffic.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import instrumentation
+
+logger = logging.getLogger('confizz.querywatch')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?|\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+# Execute wrappers sit between the query and the code that ran it.
+_WRAPPER_FILES = {__file__, instrumentation.__file__}
+
+_watchers = ContextVar('query_watchers', default=())
+
+
+class RepeatedQueries(Exception):
+    """Raised when a request runs the same query shape too many times from one place."""
+
+
+def shape(sql):
+    """``sql`` with literals and IN lists collapsed, so repeats of one query compare equal."""
+    sql = _STRING.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _project_file(filename):
+    return (
+        filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in filename
+        and filename not in _WRAPPER_FILES
+    )
+
+
+def _origin():
+    """The template line being rendered, else the innermost project frame, that ran the query."""
+    frame = sys._getframe(2)
+    code_origin = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            template = getattr(getattr(node, 'origin', None), 'template_name', None)
+            token = getattr(node, 'token', None)
+            if template and token is not None:
+                return f'{template}:{token.lineno}'
+        if code_origin is None and _project_file(code.co_filename):
+            path = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            code_origin = f'{path}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return code_origin or 'unknown'
+
+
+class QueryWatcher:
+    """The ``(shape, origin, seconds)`` of each query run inside a ``watch()`` block."""
+
+    def __init__(self):
+        self.queries = []
+
+    def repeated(self, threshold):
+        """``(shape, origin, count)`` for shapes run ``threshold`` or more times from one place."""
+        counts = Counter((query_shape, origin) for query_shape, origin, _ in self.queries)
+        return [
+            (query_shape, origin, count)
+            for (query_shape, origin), count in counts.most_common()
+            if count >= threshold
+        ]
+
+    def report(self, threshold):
+        lines = [f'{len(self.queries)} queries in {sum(q[2] for q in self.queries) * 1000:.1f} ms.']
+        for query_shape, origin, count in self.repeated(threshold):
+            lines.append(f'{count}x at {origin}: {query_shape}')
+        return '\n'.join(lines)
+
+
+def _execute(execute, sql, params, many, context):
+    watchers = _watchers.get()
+    if not watchers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        query = (shape(sql), _origin(), elapsed)
+        for watcher in watchers:
+            watcher.queries.append(query)
+        if elapsed >= getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.1):
+            logger.warning('Slow query (%.1f ms) at %s: %s', elapsed * 1000, query[1], sql)
+
+
+def _install(connection):
+    # At the front, like instrumentation's wrapper, so execute_wrapper()
+    # blocks opened around it still pop their own.
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+def _install_on_new_connection(sender, connection, **kwargs):
+    _install(connection)
+
+
+connection_created.connect(_install_on_new_connection)
+
+
+@contextmanager
+def watch():
+    """Records the queries run in the block, on any connection and thread; yields the ``QueryWatcher``."""
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+    watcher = QueryWatcher()
+    token = _watchers.set(_watchers.get() + (watcher,))
+    try:
+        yield watcher
+    finally:
+        _watchers.reset(token)
+
+
+class QueryWatchMiddleware:
+    """Flags N+1s and slow queries per request while ``QUERY_WATCH`` is on."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_WATCH', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with watch() as watcher:
+            response = self.get_response(request)
+        return self.check(request, response, watcher)
+
+    async def __acall__(self, request):
+        with watch() as watcher:
+            response = await self.get_response(request)
+        return self.check(request, response, watcher)
+
+    def check(self, request, response, watcher):
+        threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5)
+        if watcher.repeated(threshold):
+            message = f'Repeated queries in {request.method} {request.path}: {watcher.report(threshold)}'
+            if getattr(settings, 'QUERY_WATCH_ACTION', 'log') == 'raise':
+                raise RepeatedQueries(message)
+            logger.warning(message)
+        return response
+
+
+class QueryBudgetMixin:
+    """Adds ``assertQueryBudget`` to a test case."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeat_threshold=None):
+        """
+        Fails if the block runs more than ``budget`` queries, or any query
+        shape ``repeat_threshold`` (default ``QUERY_REPEAT_THRESHOLD``) times
+        from the same template line or function.
+        """
+        threshold = repeat_threshold or getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5)
+        with watch() as watcher:
+            yield watcher
+        problems = []
+        if len(watcher.queries) > budget:
+            problems.append(f'{len(watcher.queries)} queries exceed the budget of {budget}.')
+        if watcher.repeated(threshold):
+            problems.append(f'Query shapes repeated {threshold} or more times from one place.')
+        if problems:
+            self.fail(' '.join(problems) + '\n' + watcher.report(threshold))
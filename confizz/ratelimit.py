@@ -0,0 +1,152 @@
+"""
+Rate limits for the endpoints that write or cost money.
+
+``@ratelimit('comment')`` caps how often one client may call a view, at the
+rate configured for that scope in ``settings.RATELIMITS`` (``'10/m'``: ten
+requests a minute; the period is s, m, h or d, optionally with a multiple
+such as ``'100/15m'``). Requests over the limit get a 429 with a
+``Retry-After`` header and never reach the view.
+
+Clients are told apart by ``key``: ``'ip'``, ``'session'`` or ``'user'``;
+the last two fall back to the IP address for clients without a session or
+login. Async views should not key by ``'user'``, which loads the user from
+the database. The address is ``REMOTE_ADDR`` unless ``RATELIMIT_PROXY_COUNT``
+trusted proxies sit in front of the app, and IPv6 clients are counted per
+/64, the block a single host is usually given.
+
+Counting uses a sliding window approximated from two fixed windows kept in
+the Django cache: the count so far in the current window plus the previous
+window's count weighted by how much of it still overlaps the sliding one.
+That takes one atomic ``incr`` and one ``get`` per request whatever the
+rate, and the keys expire on their own. Limits are shared by every process
+using the same cache; with the default per-process locmem cache each worker
+enforces its own.
+"""
+import ipaddress
+import re
+import time
+from functools import lru_cache, wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+from confizz import instrumentation
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+_RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+LIMITED = instrumentation.Counter('confizz_ratelimited_total', 'Requests refused by a rate limit.')
+instrumentation.METRICS.append(LIMITED)
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """Turns ``'10/m'`` into ``(10, 60)``. Returns None for an empty rate, which disables the limit."""
+    if not rate:
+        return None
+    match = _RATE_RE.match(rate.replace(' ', ''))
+    if match is None:
+        raise ValueError(f'Invalid rate {rate!r}; expected e.g. "10/m" or "100/15m".')
+    count, multiple, unit = match.groups()
+    return int(count), int(multiple or 1) * PERIODS[unit]
+
+
+def client_ip(request):
+    """The client's address, taken from X-Forwarded-For only when trusted proxies add it."""
+    proxies = getattr(settings, 'RATELIMIT_PROXY_COUNT', 0)
+    ip = request.META.get('REMOTE_ADDR', '')
+    if proxies:
+        forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        if len(forwarded) >= proxies and forwarded[-proxies]:
+            ip = forwarded[-proxies]
+    if ':' in ip:
+        try:
+            ip = str(ipaddress.ip_network(f'{ip}/64', strict=False).network_address)
+        except ValueError:
+            pass
+    return ip
+
+
+def client_key(request, key):
+    if key == 'user':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+    elif key == 'session':
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key:
+            return f'session:{session.session_key}'
+    return f'ip:{client_ip(request)}'
+
+
+def hit(scope, client, rate, now=None):
+    """
+    Counts a request by ``client`` against ``scope``'s ``rate`` (as parsed by
+    ``parse_rate``). Returns 0 if it is allowed, otherwise the number of
+    seconds until it would be.
+    """
+    limit, period = rate
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    key = f'ratelimit:{scope}:{client}:{int(window)}'
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # First request of the window; another process may have beaten us to it.
+        count = 1 if cache.add(key, 1, timeout=period * 2) else cache.incr(key)
+    previous = cache.get(f'ratelimit:{scope}:{client}:{int(window) - 1}', 0)
+    if count + previous * (1 - elapsed / period) <= limit:
+        return 0
+    if count > limit:
+        return period - elapsed
+    # Over only through the previous window's weight, which shrinks as time passes.
+    return max(1.0, period * (1 - (limit - count) / previous) - elapsed)
+
+
+def check(request, scope, key='ip'):
+    """Returns seconds to wait if ``request`` is over ``scope``'s limit, else 0."""
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return 0
+    rate = parse_rate(getattr(settings, 'RATELIMITS', {}).get(scope))
+    if rate is None:
+        return 0
+    return hit(scope, client_key(request, key), rate)
+
+
+def limited_response(scope, retry_after, as_json):
+    LIMITED.inc(scope=scope)
+    message = 'Too many requests. Please slow down and try again shortly.'
+    if as_json:
+        response = JsonResponse({'error': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(max(1, round(retry_after)))
+    return response
+
+
+def ratelimit(scope, key='ip', methods=('POST',), as_json=False):
+    """
+    Applies ``scope``'s rate limit to the decorated view's ``methods``
+    requests, per client as identified by ``key``. The 429 has a JSON body
+    when ``as_json``. Works on sync and async views alike.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                # Called directly: the cache backends' async methods only run
+                # these same calls in a thread, which costs more than the calls.
+                if request.method in methods and (retry_after := check(request, scope, key)):
+                    return limited_response(scope, retry_after, as_json)
+                return await view(request, *args, **kwargs)
+            return wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods and (retry_after := check(request, scope, key)):
+                return limited_response(scope, retry_after, as_json)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+"""
+Database routing: reads from replicas, writes to the primary.
+
+Views wrapped in ``read_only`` run their reads against one of
+``settings.READ_REPLICAS`` (picked at random per request) for GET and HEAD
+requests; everything else, and every write, uses ``default``. The choice
+is held in a context variable, so it follows the request through
+``sync_to_async`` and never leaks into another thread's request.
+
+Replicas may lag. ``ReadYourWritesMiddleware`` notices unsafe requests
+that wrote to the primary and sets a cookie pinning that client's reads to
+the primary for ``REPLICA_MAX_LAG`` seconds, so the page a visitor is
+redirected to after posting shows their post.
+"""
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_read_alias = ContextVar('read_alias', default=None)
+# The middleware's record of the current request; a dict so writes made in
+# a copied context (sync_to_async) are still seen by the middleware.
+_request_writes = ContextVar('request_writes', default=None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Routes ORM reads in the block to ``alias``."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def reading_replica():
+    """True while reads are routed to a replica that may lag behind the primary."""
+    return _read_alias.get() is not None and getattr(settings, 'REPLICA_MAX_LAG', 0) > 0
+
+
+def replica_cache_timeout(timeout):
+    """Caps a cache timeout for content rendered from a lagging replica."""
+    if reading_replica():
+        return min(timeout, settings.REPLICA_MAX_LAG)
+    return timeout
+
+
+def pinned_to_primary(request):
+    """True while ``request`` comes from a client that wrote within the last REPLICA_MAX_LAG seconds."""
+    value = request.COOKIES.get(getattr(settings, 'REPLICA_PIN_COOKIE', 'read_primary_until'))
+    if not value:
+        return False
+    try:
+        return float(value) > time.time()
+    except ValueError:
+        return False
+
+
+def read_only(view):
+    """Serves safe requests to ``view`` from a read replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replicas = getattr(settings, 'READ_REPLICAS', [])
+        if not replicas or request.method not in SAFE_METHODS or pinned_to_primary(request):
+            return view(request, *args, **kwargs)
+        with reading_from(random.choice(replicas)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadYourWritesMiddleware:
+    """Pins a client's reads to the primary after a request of theirs wrote to it."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = {'wrote': False}
+        token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        return self.pin(request, response, writes)
+
+    async def __acall__(self, request):
+        writes = {'wrote': False}
+        token = _request_writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        return self.pin(request, response, writes)
+
+    def pin(self, request, response, writes):
+        lag = getattr(settings, 'REPLICA_MAX_LAG', 0)
+        if lag > 0 and writes['wrote'] and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                getattr(settings, 'REPLICA_PIN_COOKIE', 'read_primary_until'),
+                f'{time.time() + lag:.3f}',
+                max_age=math.ceil(lag),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias is a copy of the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and get its schema with the data.
+        return db == 'default'
@@ -18,9 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from confessions import views as confessions_views
+from confizz import instrumentation
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    # Prometheus scrape endpoint (METRICS_TOKEN or METRICS_ALLOWED_IPS only; 404 otherwise)
+    path("metrics", instrumentation.metrics, name="metrics"),
     # include home app urls for the root path
     path("", include("home.urls")),
     # include confessions app urls with a prefix
@@ -1,5 +1,8 @@
 from django.shortcuts import render
 
+from confessions import leaderboards
+from confessions.caching import cache_anonymous_page, leaderboard_scopes
+
+@cache_anonymous_page(leaderboard_scopes)
 def index(request):
-    print("Homepage view is called")
-    return render(request, 'home/index.html')
+    return render(request, 'home/index.html', {'leaderboards': leaderboards.current()})